@@ -0,0 +1,118 @@
+from fnmatch import fnmatchcase
+import functools
+import typing as t
+from urllib import parse as urllib_parse
+
+from .urls import Url
+
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+TRACKING_PARAMS = ("utm_*", "gclid", "fbclid", "yclid", "mc_cid", "mc_eid")
+TRAILING_SLASH_POLICIES = ("keep", "strip", "add")
+
+
+class Canonicalizer:
+    """
+    Brings URLs pointing to the same resource to a single form, so that they are fetched once:
+    lowercases the scheme and the host, drops the default port, the fragment and params matching
+    `strip_params` (shell-style patterns), sorts the query and applies the trailing slash policy.
+    Params of the query are kept as they are written: the query is rebuilt only when some are dropped
+    or reordered, and never encoded again. Results are cached, as the same links appear on many pages.
+
+    >>> canonicalize = Canonicalizer()
+    >>> canonicalize(Url('HTTPS://Example.COM:443/Shop/?b=2&utm_source=x&a=1#reviews'))
+    'https://example.com/Shop/?a=1&b=2'
+    >>> canonicalize(Url('http://example.com'))
+    'http://example.com/'
+    >>> Canonicalizer(strip_params=('page',), sort_query=False, trailing_slash='strip')(
+    ...     Url('https://example.com:8080/shop/?page=2&q=x+y')
+    ... )
+    'https://example.com:8080/shop?q=x+y'
+    >>> canonicalize(Url('https://example.com/search?q=a%20b&flag'))
+    'https://example.com/search?flag&q=a%20b'
+    >>> Canonicalizer(sort_query=False)(Url('https://example.com/search?q=a%20b&&flag'))
+    'https://example.com/search?q=a%20b&&flag'
+
+    URLs which can't be parsed are left as they are
+    >>> canonicalize(Url('http://example.com:abc/')), canonicalize(Url('http://[::1/x'))
+    ('http://example.com:abc/', 'http://[::1/x')
+    """
+
+    def __init__(
+        self,
+        strip_params: t.Sequence[str] = TRACKING_PARAMS,
+        sort_query: bool = True,
+        trailing_slash: str = "keep",
+        cache_size: int = 65536,
+    ) -> None:
+        if trailing_slash not in TRAILING_SLASH_POLICIES:
+            raise ValueError(f"trailing_slash has to be one of {TRAILING_SLASH_POLICIES}, not {trailing_slash!r}")
+        self.strip_params = tuple(strip_params)
+        self.sort_query = sort_query
+        self.trailing_slash = trailing_slash
+        self._cached_canonicalize = functools.lru_cache(maxsize=cache_size)(self.canonicalize)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.strip_params}, {self.sort_query}, {self.trailing_slash})"
+
+    def __call__(self, url: Url) -> Url:
+        return self._cached_canonicalize(url)
+
+    def canonicalize(self, url: Url) -> Url:
+        try:
+            parsed = urllib_parse.urlsplit(url)
+            scheme = parsed.scheme.lower()
+            netloc = self._get_netloc(parsed, scheme)
+        except ValueError:
+            # malformed, like with an invalid port; left as it is, to fail on its own when it's fetched
+            return url
+        return Url(
+            urllib_parse.urlunsplit((scheme, netloc, self._get_path(parsed.path), self._get_query(parsed.query), ""))
+        )
+
+    def cache_info(self) -> t.Dict[str, int]:
+        info = self._cached_canonicalize.cache_info()
+        return {"hits": info.hits, "misses": info.misses}
+
+    @staticmethod
+    def _get_netloc(parsed: urllib_parse.SplitResult, scheme: str) -> str:
+        host = parsed.hostname or ""
+        if ":" in host:
+            host = f"[{host}]"
+        if parsed.port and parsed.port != DEFAULT_PORTS.get(scheme):
+            host = f"{host}:{parsed.port}"
+        userinfo, _, _ = parsed.netloc.rpartition("@")
+        return f"{userinfo}@{host}" if userinfo else host
+
+    def _get_path(self, path: str) -> str:
+        if not path:
+            return "/"
+        if self.trailing_slash == "strip" and path != "/":
+            return path.rstrip("/") or "/"
+        if self.trailing_slash == "add" and not path.endswith("/"):
+            return f"{path}/"
+        return path
+
+    def _get_query(self, query: str) -> str:
+        if not query or not (self.strip_params or self.sort_query):
+            return query
+        params = [param for param in query.split("&") if param]
+        kept = [param for param in params if not self._is_stripped(param)]
+        if self.sort_query:
+            kept.sort(key=decode_param)
+        if kept == params:
+            return query
+        return "&".join(kept)
+
+    def _is_stripped(self, param: str) -> bool:
+        name, _ = decode_param(param)
+        return any(fnmatchcase(name, pattern) for pattern in self.strip_params)
+
+
+def decode_param(param: str) -> t.Tuple[str, str]:
+    """
+    >>> decode_param('q=a%20b+c'), decode_param('flag')
+    (('q', 'a b c'), ('flag', ''))
+    """
+    name, _, value = param.partition("=")
+    return urllib_parse.unquote_plus(name), urllib_parse.unquote_plus(value)
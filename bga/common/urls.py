@@ -1,3 +1,4 @@
+import functools
 from pathlib import Path
 from urllib import parse as urllib_parse
 import typing as t
@@ -6,8 +7,11 @@ import typing as t
 Url = t.NewType("Url", str)
 
 
+@functools.lru_cache(maxsize=65536)
 def get_url(current_href: str, relative: str) -> Url:
     """
+    Joins the relative href with the current one. Cached, as pages repeat the same hrefs many times.
+
     >>> get_url('https://www.iana.org/domains/reserved', '/domains/int')
     'https://www.iana.org/domains/int'
     >>> get_url('https://www.iana.org/domains/reserved/', '/domains/int')
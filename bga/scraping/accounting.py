@@ -0,0 +1,49 @@
+from collections import Counter, deque
+import typing as t
+
+from bga.common.urls import Url
+
+
+class CrawlAccount:
+    """
+    Running account of a spider's crawl: counters of failed and invalid URLs and of errors, with only
+    the most recent `recent` of each kept, so that memory stays flat however long the crawl is.
+    Errors are kept as their representations, not to keep their tracebacks (and frames) alive.
+
+    >>> account = CrawlAccount(recent=2)
+    >>> for i in range(3):
+    ...     account.failed(Url(f'https://example.com/{i}'))
+    >>> account.error(Url('https://example.com/3'), ValueError('boom'))
+    >>> account.report()  # doctest: +NORMALIZE_WHITESPACE
+    {'urls_failed': 3, 'urls_invalid': 0, 'errors': 1,
+     'recent_urls_failed': ['https://example.com/1', 'https://example.com/2'], 'recent_urls_invalid': [],
+     'recent_errors': ["https://example.com/3: ValueError('boom')"]}
+    """
+
+    def __init__(self, recent: int = 50) -> None:
+        self.counts: t.Counter[str] = Counter()
+        self.recent_failed: t.Deque[Url] = deque(maxlen=recent)
+        self.recent_invalid: t.Deque[Url] = deque(maxlen=recent)
+        self.recent_errors: t.Deque[str] = deque(maxlen=recent)
+
+    def failed(self, url: Url) -> None:
+        self.counts["urls_failed"] += 1
+        self.recent_failed.append(url)
+
+    def invalid(self, url: Url) -> None:
+        self.counts["urls_invalid"] += 1
+        self.recent_invalid.append(url)
+
+    def error(self, url: Url, error: Exception) -> None:
+        self.counts["errors"] += 1
+        self.recent_errors.append(f"{url}: {error!r}")
+
+    def report(self) -> t.Dict[str, t.Any]:
+        return {
+            "urls_failed": self.counts["urls_failed"],
+            "urls_invalid": self.counts["urls_invalid"],
+            "errors": self.counts["errors"],
+            "recent_urls_failed": list(self.recent_failed),
+            "recent_urls_invalid": list(self.recent_invalid),
+            "recent_errors": list(self.recent_errors),
+        }
@@ -0,0 +1,109 @@
+import tracemalloc
+import typing as t
+
+import click
+from parsel import SelectorList
+from rich import print as rprint
+
+from bga.common.measures import Timer
+from bga.scraping.page import (
+    Css,
+    PageFragment,
+    PageModel,
+    XPath,
+)
+from bga.scraping.texttools import clean_money
+
+
+class ParselXPath(XPath):
+    """Reference field evaluating its expression with parsel on every access, as fields did before compiling."""
+
+    def _get_selector(self, page_fragment: PageFragment) -> SelectorList:
+        return page_fragment.selector.xpath(self.xpath)
+
+
+class ParselCss(Css):
+    def _get_selector(self, page_fragment: PageFragment) -> SelectorList:
+        return page_fragment.selector.css(self.css_selector)
+
+
+def make_models(css: t.Type[Css], xpath: t.Type[XPath], compact_items: bool = False) -> t.Type[PageModel]:
+    class Product(PageFragment):
+        name = css("a.name::text")
+        url = css("a.name::attr(href)")
+        image = xpath(".//img/@src")
+        price = css("span.price::text", clean=clean_money)
+        availability = xpath(".//span[@class='availability']/text()")
+
+    class Catalogue(PageModel):
+        title = xpath("//head/title/text()")
+        items = css("div.product", many=True, model=Product)
+
+    Catalogue.compact_items = compact_items
+    return Catalogue
+
+
+def make_catalogue(items: int) -> str:
+    products = "".join(
+        f"<div class='product'><a class='name' href='/product/{i}'>Product {i}</a>"
+        f"<img src='/media/{i}.jpg'/><span class='price'>{i},99 PLN</span>"
+        f"<span class='availability'>in stock</span></div>"
+        for i in range(items)
+    )
+    return f"<html><head><title>Catalogue</title></head><body>{products}</body></html>"
+
+
+def measure_peak_memory(extract: t.Callable[[], t.Any]) -> int:
+    tracemalloc.start()
+    try:
+        extract()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_retained_memory(extract: t.Callable[[], t.Any]) -> int:
+    tracemalloc.start()
+    try:
+        extracted = extract()  # noqa: F841 kept alive while measured
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(model_class: t.Type[PageModel], html: str, repeat: int) -> Timer:
+    with Timer() as timer:
+        for _ in range(repeat):
+            model_class(html).extracted
+    return timer
+
+
+@click.command()
+@click.option("--items", type=click.INT, default=2000, help="Number of products on the synthetic catalogue page")
+@click.option("--repeat", type=click.INT, default=10)
+def command(items: int, repeat: int):
+    """Compares extraction with compiled queries against evaluating each expression with parsel."""
+    html = make_catalogue(items)
+    compiled, reference = make_models(Css, XPath), make_models(ParselCss, ParselXPath)
+    assert compiled(html).extracted == reference(html).extracted
+    reference_timer = measure(reference, html, repeat)
+    compiled_timer = measure(compiled, html, repeat)
+    speedup = reference_timer.wall_elapsed / compiled_timer.wall_elapsed
+    rprint(f"[yellow]{items} items x {repeat} pages")
+    rprint(f"parsel:   {reference_timer.wall_elapsed}")
+    rprint(f"compiled: {compiled_timer.wall_elapsed}")
+    rprint(f"[bright_white]speed-up: {speedup:.2f}x")
+    body = html.encode()
+    text_peak = measure_peak_memory(lambda: compiled(body.decode()))
+    body_peak = measure_peak_memory(lambda: compiled.from_body(body, "utf-8"))
+    rprint(f"peak memory parsing text: {text_peak // 1024} KiB")
+    rprint(f"peak memory parsing body: {body_peak // 1024} KiB")
+    compact = make_models(Css, XPath, compact_items=True)
+    dicts_retained = measure_retained_memory(lambda: compiled(html).extracted)
+    records_retained = measure_retained_memory(lambda: compact(html).extracted)
+    rprint(f"memory retained by items as dicts:   {dicts_retained // 1024} KiB")
+    rprint(f"memory retained by items as records: {records_retained // 1024} KiB")
+
+
+if __name__ == "__main__":
+    command()
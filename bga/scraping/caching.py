@@ -0,0 +1,227 @@
+import asyncio
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+from pathlib import Path
+import typing as t
+
+from httpx import Request, Response
+
+from bga.common.urls import Url
+from .signals import SIGNALS
+
+
+FetchFunction = t.Callable[..., t.Awaitable[Response]]
+
+# the body is stored decoded, so headers describing its transfer encoding no longer apply
+SKIPPED_HEADERS = frozenset(("content-encoding", "content-length", "transfer-encoding"))
+
+
+@dataclass
+class CacheEntry:
+    url: Url
+    status_code: int
+    headers: t.Dict[str, str]
+    stored_at: float  # timestamp
+
+    def is_fresh(self, ttl: t.Optional[timedelta], now: float) -> bool:
+        """
+        >>> entry = CacheEntry(url=Url('https://example.com'), status_code=200, headers={}, stored_at=100.0)
+        >>> entry.is_fresh(timedelta(seconds=60), now=150.0), entry.is_fresh(timedelta(seconds=60), now=170.0)
+        (True, False)
+        >>> entry.is_fresh(None, now=100.0)
+        False
+        """
+        return ttl is not None and now - self.stored_at < ttl.total_seconds()
+
+    @property
+    def validators(self) -> t.Dict[str, str]:
+        """
+        >>> CacheEntry(
+        ...     url=Url('https://example.com'),
+        ...     status_code=200,
+        ...     headers={'etag': '"abc"', 'last-modified': 'Wed, 21 Oct 2015 07:28:00 GMT'},
+        ...     stored_at=0.0,
+        ... ).validators
+        {'if-none-match': '"abc"', 'if-modified-since': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+        """
+        validators = {}
+        if etag := self.headers.get("etag"):
+            validators["if-none-match"] = etag
+        if last_modified := self.headers.get("last-modified"):
+            validators["if-modified-since"] = last_modified
+        return validators
+
+
+class ResponseCache:
+    """
+    Stores successful responses on disk, one metadata file and one body file per URL.
+    Fresh entries (younger than `ttl`) are served without a request; stale ones are revalidated
+    with a conditional request and served from the disk on `304 Not Modified`. When the total size
+    of the cache exceeds `max_size`, the least recently used entries are evicted.
+    Files are read and written in the loop's default executor, while the index is kept by the loop.
+    An entry whose files are gone is a miss: it's dropped and the response is fetched in full.
+    """
+
+    def __init__(self, directory: Path, ttl: t.Optional[timedelta] = None, max_size: int = 0, owner: t.Any = None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.owner = owner
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # LRU index: key -> (size in bytes, last usage timestamp)
+        self._index: t.Dict[str, t.Tuple[int, float]] = self._scan()
+        self._stats: t.Dict[str, int] = {"hits": 0, "revalidated": 0, "misses": 0, "evicted": 0}
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.directory})"
+
+    @property
+    def size(self) -> int:
+        return sum(size for size, _ in self._index.values())
+
+    def stats(self) -> t.Dict[str, int]:
+        return {**self._stats, "entries": len(self._index), "size": self.size}
+
+    async def fetch(self, url: Url, fetch: FetchFunction, request_kwargs: dict = None) -> Response:
+        request_kwargs = request_kwargs or {}
+        now = datetime.now().timestamp()
+        entry = await self.get(url)
+        if entry and entry.is_fresh(self.ttl, now):
+            if (response := await self._hit(entry, revalidated=False)) is not None:
+                return response
+            entry = None
+        if entry and (validators := entry.validators):
+            response = await fetch(
+                url, request_kwargs={**request_kwargs, "headers": {**request_kwargs.get("headers", {}), **validators}}
+            )
+        else:
+            response = await fetch(url, request_kwargs=request_kwargs)
+        if entry and response.status_code == 304:
+            entry.stored_at = now
+            if (cached := await self._hit(entry, revalidated=True)) is not None:
+                return cached
+            # the body is gone, so the response is fetched in full
+            response = await fetch(url, request_kwargs=request_kwargs)
+        self._stats["misses"] += 1
+        SIGNALS.spider.url_cache_miss.send(self.owner or self, url=url, response=response)
+        if response.status_code == 200:
+            await self.store(url, response, now)
+        return response
+
+    async def fetch_fresh(self, url: Url) -> t.Optional[Response]:
+        """The stored response, when it's fresh enough to be served without a request."""
+        entry = await self.get(url)
+        if entry and entry.is_fresh(self.ttl, datetime.now().timestamp()):
+            return await self._hit(entry, revalidated=False)
+        return None
+
+    async def get(self, url: Url) -> t.Optional[CacheEntry]:
+        key = self._key(url)
+        if key not in self._index:
+            return None
+        try:
+            return await self._run(self._read_entry, key)
+        except (OSError, ValueError, TypeError):
+            await self._remove(key)
+            return None
+
+    async def store(self, url: Url, response: Response, now: float) -> None:
+        key = self._key(url)
+        headers = {k: v for k, v in response.headers.items() if k not in SKIPPED_HEADERS}
+        entry = CacheEntry(url=url, status_code=response.status_code, headers=headers, stored_at=now)
+        self._index[key] = await self._run(self._write, key, entry, response.content)
+        await self._evict()
+
+    @staticmethod
+    def to_response(entry: CacheEntry, body: bytes) -> Response:
+        return Response(
+            status_code=entry.status_code,
+            headers=entry.headers,
+            content=body,
+            request=Request("GET", entry.url),
+        )
+
+    async def _hit(self, entry: CacheEntry, revalidated: bool) -> t.Optional[Response]:
+        """Serves the entry from the disk; None when its body is gone (and the entry is dropped)."""
+        key = self._key(entry.url)
+        try:
+            body, self._index[key] = await self._run(self._load, key, entry if revalidated else None)
+        except OSError:
+            await self._remove(key)
+            return None
+        self._stats["revalidated" if revalidated else "hits"] += 1
+        SIGNALS.spider.url_cache_hit.send(self.owner or self, url=entry.url, revalidated=revalidated)
+        return self.to_response(entry, body)
+
+    async def _evict(self) -> None:
+        if not self.max_size:
+            return
+        total = self.size
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if total <= self.max_size:
+                break
+            await self._remove(key)
+            self._stats["evicted"] += 1
+            total -= size
+
+    async def _remove(self, key: str) -> None:
+        self._index.pop(key, None)
+        await self._run(self._unlink, key)
+
+    @staticmethod
+    async def _run(function: t.Callable, *args: t.Any) -> t.Any:
+        return await asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+    # functions below do the I/O and run in the executor
+
+    def _read_entry(self, key: str) -> CacheEntry:
+        return CacheEntry(**json.loads(self._meta_path(key).read_text()))
+
+    def _load(self, key: str, revalidated: t.Optional[CacheEntry]) -> t.Tuple[bytes, t.Tuple[int, float]]:
+        """Reads the body and marks the entry as used; a revalidated entry is written again."""
+        body = self._body_path(key).read_bytes()
+        if revalidated:
+            return body, self._write(key, revalidated)
+        os.utime(self._meta_path(key))
+        return body, self._stat(key)
+
+    def _write(self, key: str, entry: CacheEntry, body: t.Optional[bytes] = None) -> t.Tuple[int, float]:
+        if body is not None:
+            self._body_path(key).write_bytes(body)
+        self._meta_path(key).write_text(json.dumps(asdict(entry)))
+        return self._stat(key)
+
+    def _stat(self, key: str) -> t.Tuple[int, float]:
+        meta_stat = self._meta_path(key).stat()
+        return meta_stat.st_size + self._body_path(key).stat().st_size, meta_stat.st_mtime
+
+    def _unlink(self, key: str) -> None:
+        for path in (self._meta_path(key), self._body_path(key)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _scan(self) -> t.Dict[str, t.Tuple[int, float]]:
+        index = {}
+        for meta_path in self.directory.glob("*.json"):
+            key = meta_path.stem
+            try:
+                meta_stat, body_stat = meta_path.stat(), self._body_path(key).stat()
+            except OSError:
+                continue
+            index[key] = (meta_stat.st_size + body_stat.st_size, meta_stat.st_mtime)
+        return index
+
+    def _meta_path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _body_path(self, key: str) -> Path:
+        return self.directory / f"{key}.body"
+
+    @staticmethod
+    def _key(url: Url) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
@@ -0,0 +1,235 @@
+import asyncio
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+from pathlib import Path
+import sqlite3
+import typing as t
+
+from bga.common.files import get_data_filepath
+from .config import ProcessState
+from .page import ItemRecord
+from .signals import SIGNALS
+from .spider import Spider
+
+
+NEW = "new"
+CHANGED = "changed"
+DISAPPEARED = "disappeared"
+
+
+def item_hash(item: dict) -> int:
+    """
+    Signed 64-bit hash of the item's values, not depending on the order of its fields.
+
+    >>> item_hash({'url': '/a', 'price': {'amount': '10.00'}}) == item_hash({'price': {'amount': '10.00'}, 'url': '/a'})
+    True
+    >>> item_hash({'url': '/a', 'price': {'amount': '10.00'}}) == item_hash({'url': '/a', 'price': {'amount': '9.99'}})
+    False
+    """
+    serialized = json.dumps(item, sort_keys=True, ensure_ascii=False, default=str).encode()
+    return int.from_bytes(hashlib.blake2b(serialized, digest_size=8).digest(), "big", signed=True)
+
+
+class ChangeIndex:
+    """
+    Hashes of the items of each spider by their keys, with the run they were last seen in, in an SQLite file.
+    Tells which items of a run are new or changed and, at its end, which ones disappeared.
+    Writes are buffered and flushed every `flush_every` items. Not thread-safe, but it can be used
+from a thread other than the one creating it.
+
+    >>> index = ChangeIndex(Path(':memory:'))
+    >>> index.update('shop', 'run-1', {'/a': 1, '/b': 2})
+    {'/a': 'new', '/b': 'new'}
+    >>> index.update('shop', 'run-2', {'/a': 1, '/b': 3, '/c': 4})
+    {'/b': 'changed', '/c': 'new'}
+    >>> index.remove_unseen('shop', 'run-2'), index.remove_unseen('shop', 'run-3')
+    ([], ['/a', '/b', '/c'])
+    """
+
+    def __init__(self, path: Path, flush_every: int = 1000) -> None:
+        self.path = path
+        self.flush_every = flush_every
+        if path.name != ":memory:":
+            path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS items (spider TEXT NOT NULL, key TEXT NOT NULL, hash INTEGER NOT NULL, "
+                "run TEXT NOT NULL, PRIMARY KEY (spider, key)) WITHOUT ROWID"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS items_spider_run ON items (spider, run)")
+        self._pending: t.Dict[t.Tuple[str, str], t.Tuple[int, str]] = {}
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path})"
+
+    def update(self, spider: str, run: str, hashes: t.Mapping[str, int]) -> t.Dict[str, str]:
+        """Records the items as seen in the run; returns kinds of changes of the new and changed ones."""
+        known = self._get_hashes(spider, hashes)
+        changes = {}
+        for key, value in hashes.items():
+            if (previous := known.get(key)) is None:
+                changes[key] = NEW
+            elif previous != value:
+                changes[key] = CHANGED
+            self._pending[spider, key] = (value, run)
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+        return changes
+
+    def remove_unseen(self, spider: str, run: str) -> t.List[str]:
+        """Forgets items of the spider not seen in the run; returns their keys."""
+        self.flush()
+        keys = [
+            key
+            for (key,) in self._connection.execute(
+                "SELECT key FROM items WHERE spider = ? AND run != ? ORDER BY key", (spider, run)
+            )
+        ]
+        with self._connection:
+            self._connection.execute("DELETE FROM items WHERE spider = ? AND run != ?", (spider, run))
+        return keys
+
+    def flush(self) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)",
+                ((spider, key, value, run) for (spider, key), (value, run) in self._pending.items()),
+            )
+        self._pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
+
+    def _get_hashes(self, spider: str, keys: t.Iterable[str]) -> t.Dict[str, int]:
+        known, missing = {}, []
+        for key in keys:
+            if (pending := self._pending.get((spider, key))) is not None:
+                known[key] = pending[0]
+            else:
+                missing.append(key)
+        if missing:
+            placeholders = ", ".join("?" * len(missing))
+            rows = self._connection.execute(
+                f"SELECT key, hash FROM items WHERE spider = ? AND key IN ({placeholders})", (spider, *missing)
+            )
+            known.update(rows)
+        return known
+
+
+class ChangeDetector:
+    """
+    Compares items sent with `output:items_extracted` with the ones extracted by previous runs,
+    by their keys (see `PageModel.item_key`; items without one are skipped), and sends new and changed
+    items with `output:items_changed`. When a spider ends, items it hasn't seen are sent as disappeared,
+    but only after a complete crawl, which could have seen them all: not cut short (by a deadline,
+    cancellation or crash), not resumed, without failed or invalid URLs and unchanged pages skipped.
+    Otherwise unseen items are kept, until a complete crawl.
+    The index is queried and updated in a thread of its own, one page of items at a time, in the order
+    they were sent; leaving the detector waits for the queued ones.
+    """
+
+    # SQLite's default limit of parameters of a statement is 999
+    BATCH_SIZE = 900
+
+    def __init__(self, process_state: ProcessState) -> None:
+        self.process_state = process_state
+        self.index = ChangeIndex(get_data_filepath("scraping/changes.sqlite"))
+        self.runs: t.DefaultDict[str, str] = defaultdict(lambda: process_state.start.isoformat(timespec="seconds"))
+        self._resumed: t.Set[str] = set()
+        self._jobs: t.Deque[t.Tuple[Spider, t.Callable[..., t.List[dict]], tuple]] = deque()
+        self._job_ready: t.Optional[asyncio.Event] = None
+        self._is_closing: bool = False
+        self._worker: t.Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="changes")
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.index.path})"
+
+    async def __aenter__(self) -> "ChangeDetector":
+        self._job_ready = asyncio.Event()
+        self._worker = asyncio.create_task(self._work())
+        SIGNALS.spider.spider_started.connect(self.start_run)
+        SIGNALS.spider.spider_resumed.connect(self.resume_run)
+        SIGNALS.output.items_extracted.connect(self.detect)
+        SIGNALS.spider.spider_ended.connect(self.end_run)
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        SIGNALS.spider.spider_started.disconnect(self.start_run)
+        SIGNALS.spider.spider_resumed.disconnect(self.resume_run)
+        SIGNALS.output.items_extracted.disconnect(self.detect)
+        SIGNALS.spider.spider_ended.disconnect(self.end_run)
+        self._is_closing = True
+        self._job_ready.set()
+        await self._worker
+        await asyncio.get_event_loop().run_in_executor(self._executor, self.index.close)
+        self._executor.shutdown()
+
+    def start_run(self, sender: Spider, run_id: str, **kwargs) -> None:
+        self.runs[sender.name] = run_id
+        self._resumed.discard(sender.name)
+
+    def resume_run(self, sender: Spider, **kwargs) -> None:
+        self._resumed.add(sender.name)
+
+    def detect(self, sender: Spider, items: t.List[t.Union[dict, ItemRecord]], item_key: str = None, **kwargs):
+        if not item_key:
+            return
+        by_key = {}
+        for item in items:
+            item = item.to_dict() if isinstance(item, ItemRecord) else item
+            if (key := item.get(item_key)) is not None:
+                by_key[str(key)] = item
+        if by_key:
+            self._submit(sender, self._detect, self.runs[sender.name], by_key)
+
+    def end_run(
+        self,
+        sender: Spider,
+        is_complete: bool = False,
+        urls_failed: int = 0,
+        urls_invalid: int = 0,
+        pages_unchanged: int = 0,
+        **kwargs,
+    ) -> None:
+        # items of pages which weren't fetched, failed or were skipped are unseen, not necessarily gone
+        if not is_complete or urls_failed or urls_invalid or pages_unchanged or sender.name in self._resumed:
+            return
+        self._submit(sender, self._remove_unseen, self.runs[sender.name])
+
+    def _submit(self, sender: Spider, function: t.Callable[..., t.List[dict]], *args: t.Any) -> None:
+        self._jobs.append((sender, function, args))
+        self._job_ready.set()
+
+    async def _work(self) -> None:
+        loop = asyncio.get_event_loop()
+        while not (self._is_closing and not self._jobs):
+            if not self._jobs:
+                self._job_ready.clear()
+                await self._job_ready.wait()
+                continue
+            sender, function, args = self._jobs.popleft()
+            try:
+                changes = await loop.run_in_executor(self._executor, function, sender.name, *args)
+            except Exception as e:
+                SIGNALS.meta.error.send(self, error=e)
+                continue
+            if changes:
+                SIGNALS.output.items_changed.send(sender, changes=changes)
+
+    def _detect(self, spider: str, run: str, by_key: t.Dict[str, dict]) -> t.List[dict]:
+        changes = []
+        keys = list(by_key)
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            hashes = {key: item_hash(by_key[key]) for key in keys[start:start + self.BATCH_SIZE]}
+            kinds = self.index.update(spider, run, hashes)
+            changes.extend({"change": kind, "key": key, "item": by_key[key]} for key, kind in kinds.items())
+        return changes
+
+    def _remove_unseen(self, spider: str, run: str) -> t.List[dict]:
+        keys = self.index.remove_unseen(spider, run)
+        return [{"change": DISAPPEARED, "key": key, "item": None} for key in keys]
@@ -0,0 +1,224 @@
+from array import array
+import enum
+import hashlib
+import math
+from pathlib import Path
+import sqlite3
+import typing as t
+
+from bga.common.urls import Url
+
+
+class UrlState(enum.IntEnum):
+    QUEUED = 0
+    DONE = 1
+    FAILED = 2
+    INVALID = 3
+
+
+def url_fingerprint(url: Url) -> int:
+    """
+    Signed 64-bit fingerprint of the URL, fitting SQLite's INTEGER.
+
+    >>> url_fingerprint(Url('https://example.com/a')) == url_fingerprint(Url('https://example.com/a'))
+    True
+    >>> -2 ** 63 <= url_fingerprint(Url('https://example.com/b')) < 2 ** 63
+    True
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+class FingerprintSet:
+    """
+    Exact set of 64-bit fingerprints, kept in a flat array with open addressing: 8 bytes per slot,
+    at most 2/3 of slots used, instead of a Python object per element.
+
+    >>> fingerprints = FingerprintSet(capacity=2)
+    >>> [fingerprints.add(f) for f in (5, -7, 5, 0, 2 ** 40)]
+    [True, True, False, True, True]
+    >>> len(fingerprints), -7 in fingerprints, 6 in fingerprints
+    (4, True, False)
+    """
+
+    # zero marks an empty slot, so the (unlikely) zero fingerprint is stored as its neighbour
+    EMPTY = 0
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._slots = array("q", bytes(8 * self._slots_for(capacity)))
+        self._size: int = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, fingerprint: int) -> bool:
+        slots, mask = self._slots, len(self._slots) - 1
+        fingerprint = fingerprint or 1
+        index = fingerprint & mask
+        while (slot := slots[index]) != self.EMPTY:
+            if slot == fingerprint:
+                return True
+            index = (index + 1) & mask
+        return False
+
+    def add(self, fingerprint: int) -> bool:
+        """Adds the fingerprint; returns False if it was already there."""
+        if 3 * (self._size + 1) > 2 * len(self._slots):
+            self._grow()
+        slots, mask = self._slots, len(self._slots) - 1
+        fingerprint = fingerprint or 1
+        index = fingerprint & mask
+        while (slot := slots[index]) != self.EMPTY:
+            if slot == fingerprint:
+                return False
+            index = (index + 1) & mask
+        slots[index] = fingerprint
+        self._size += 1
+        return True
+
+    def _grow(self) -> None:
+        old_slots = self._slots
+        self._slots = array("q", bytes(16 * len(old_slots)))
+        self._size = 0
+        for fingerprint in old_slots:
+            if fingerprint != self.EMPTY:
+                self.add(fingerprint)
+
+    @staticmethod
+    def _slots_for(capacity: int) -> int:
+        return 1 << max(math.ceil(math.log2(capacity * 3 / 2 + 1)), 3)
+
+
+class BloomFilter:
+    """
+    Probabilistic set of 64-bit fingerprints: about 1.2 MB per million elements at 1% of false positives.
+    A false positive means a new URL is taken as seen and skipped.
+
+    >>> bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    >>> [bloom.add(f) for f in (5, -7, 5)]
+    [True, True, False]
+    >>> len(bloom), -7 in bloom, len(bloom.bits)
+    (2, True, 1199)
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.bits = bytearray((size + 7) // 8)
+        self.size = len(self.bits) * 8
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self._count: int = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, fingerprint: int) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(fingerprint))
+
+    def add(self, fingerprint: int) -> bool:
+        """Adds the fingerprint; returns False if it (probably) was already there."""
+        is_new = False
+        for position in self._positions(fingerprint):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                is_new = True
+        self._count += is_new
+        return is_new
+
+    def _positions(self, fingerprint: int) -> t.Iterator[int]:
+        # double hashing with both halves of the fingerprint
+        first, second = fingerprint & 0xFFFFFFFF, (fingerprint >> 32) & 0xFFFFFFFF | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+
+class SeenUrls:
+    """
+    URLs already registered by a spider, kept as fingerprints only.
+
+    >>> seen = SeenUrls()
+    >>> seen.add(Url('https://example.com/a')), seen.add(Url('https://example.com/a'))
+    (True, False)
+    >>> len(seen), Url('https://example.com/a') in seen
+    (1, True)
+    """
+
+    def __init__(self, bloom_capacity: t.Optional[int] = None, bloom_error_rate: float = 0.001) -> None:
+        self._fingerprints: t.Union[FingerprintSet, BloomFilter] = (
+            BloomFilter(bloom_capacity, bloom_error_rate) if bloom_capacity else FingerprintSet()
+        )
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def __contains__(self, url: Url) -> bool:
+        return url_fingerprint(url) in self._fingerprints
+
+    def add(self, url: Url) -> bool:
+        return self._fingerprints.add(url_fingerprint(url))
+
+
+class Checkpoint:
+    """
+    Journal of the spider's URLs and their states in an SQLite file, so that an interrupted crawl can
+    be resumed. Changes are buffered and written in order, in a single transaction per `flush_every`
+    changes: a crash loses only the latest changes, and URLs whose processing wasn't recorded as finished
+    are queued again on resume.
+
+    >>> checkpoint = Checkpoint(Path(':memory:'), flush_every=2)
+    >>> checkpoint.queue(Url('https://example.com/a'), 'app:Model', priority=0, attempt=0)
+    >>> checkpoint.queue(Url('https://example.com/b'), 'app:Model', priority=0, attempt=0)
+    >>> checkpoint.finish(Url('https://example.com/a'), UrlState.DONE)
+    >>> checkpoint.flush()
+    >>> [(row[0], row[4]) for row in checkpoint.load()]
+    [('https://example.com/a', <UrlState.DONE: 1>), ('https://example.com/b', <UrlState.QUEUED: 0>)]
+    """
+
+    def __init__(self, path: Path, flush_every: int = 500) -> None:
+        self.path = path
+        self.flush_every = flush_every
+        if path.name != ":memory:":
+            path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(path))
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "fingerprint INTEGER NOT NULL UNIQUE, url TEXT, model TEXT, priority INTEGER, attempt INTEGER, "
+            "state INTEGER)"
+        )
+        self._changes: t.List[t.Tuple[str, tuple]] = []
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path})"
+
+    def load(self) -> t.Iterator[t.Tuple[Url, str, int, int, UrlState]]:
+        rows = self._connection.execute("SELECT url, model, priority, attempt, state FROM urls ORDER BY rowid")
+        for url, model, priority, attempt, state in rows:
+            yield Url(url), model, priority, attempt, UrlState(state)
+
+    def queue(self, url: Url, model_path: str, priority: int, attempt: int) -> None:
+        self._record(
+            "INSERT OR REPLACE INTO urls (fingerprint, url, model, priority, attempt, state) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (url_fingerprint(url), url, model_path, priority, attempt, UrlState.QUEUED),
+        )
+
+    def finish(self, url: Url, state: UrlState) -> None:
+        self._record("UPDATE urls SET state = ? WHERE fingerprint = ?", (state, url_fingerprint(url)))
+
+    def flush(self) -> None:
+        with self._connection:
+            for statement, parameters in self._changes:
+                self._connection.execute(statement, parameters)
+        self._changes.clear()
+
+    def clear(self) -> None:
+        self._changes.clear()
+        with self._connection:
+            self._connection.execute("DELETE FROM urls")
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
+
+    def _record(self, statement: str, parameters: tuple) -> None:
+        self._changes.append((statement, parameters))
+        if len(self._changes) >= self.flush_every:
+            self.flush()
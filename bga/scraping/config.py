@@ -12,11 +12,19 @@ import typing as t
 
 from pca.data.descriptors import reify
 
+from bga.common.canonicalization import TRACKING_PARAMS
 from bga.common.urls import Url
 from .page import PageModel
 from .fetching import Response
 
 
+@dataclass
+class StoragePolicy:
+    max_queued: int = 10000  # items waiting to be written; spiders don't take new URLs while there are more
+    batch_size: int = 1000  # items written at once
+    batch_interval: float = 1.0  # in seconds; the longest time items wait for their batch to fill
+
+
 @dataclass
 class ProcessState:
 
@@ -26,7 +34,17 @@ class ProcessState:
     timeout: int = 3600  # in seconds
     slow_task_duration = 2.5  # in seconds
     is_scheduler_on: bool = False
+    is_daemon: bool = False  # whether the process stays resident; see `bga.scraping.daemon`
+    check_interval: int = 60  # in seconds; how often the daemon looks for spiders to start
     spiders_chosen: t.Tuple[str, ...] = ()
+    extraction_executor: t.Optional[str] = None  # "process", "thread" or None to extract on the event loop
+    extraction_workers: t.Optional[int] = None  # None means the executor's default
+    resume: bool = False  # whether spiders continue their interrupted crawls from checkpoints
+    workers: int = 1  # processes running the spiders; see `bga.scraping.sharding`
+    storage: str = "jsonl"  # where the items go; see `bga.scraping.storage.STORAGES`
+    storage_policy: StoragePolicy = StoragePolicy()
+    detect_changes: bool = False  # whether changes of items across runs are reported; see `bga.scraping.changes`
+    export: bool = False  # whether tables of the run are exported to Parquet files; see `bga.scraping.export`
 
     @reify
     def start_as_filename(self) -> str:
@@ -52,14 +70,65 @@ class ProcessState:
     def output_filepath(self) -> str:
         return f"scraping/{self.start_as_filename}.output.json"
 
+    @reify
+    def output_dirpath(self) -> str:
+        return f"scraping/{self.start_as_filename}.output"
+
 
 @dataclass
 class ConcurrencyPolicy:
-    task_check_interval: int = 5  # in seconds
-    task_limit: int = 3
-    request_delay: float = 0.5  # in seconds
-    url_retries: int = 2
-    retry_delay: float = 0.5  # in seconds
+    task_check_interval: int = 5  # in seconds; interval of progress ticks
+    workers: int = 10  # coroutines processing URLs of the frontier; requests are limited by the limits below
+    page_order: str = "discovery"  # or "details_first" (depth-first) or "catalogue_first"; see `Frontier`
+    max_details_queued: t.Optional[int] = None  # catalogue pages wait while more details pages are queued
+    task_limit: int = 3  # initial limit of concurrent requests, adjusted between the bounds below
+    min_task_limit: int = 1
+    max_task_limit: int = 10
+    latency_threshold: t.Optional[float] = 2.0  # in seconds; slower responses don't raise the limit
+    request_delay: float = 0.5  # in seconds; minimal spacing between requests to a host
+    request_rate: t.Optional[float] = None  # in requests per second per host; None means no token bucket
+    request_burst: int = 1
+    url_retries: int = 2  # attempts per URL, including the first one
+    retry_delay: float = 0.5  # in seconds; delay of the first retry, multiplied by `retry_backoff` for each next one
+    retry_backoff: float = 2.0
+    retry_max_delay: float = 60.0  # in seconds; caps both the backoff and server's `Retry-After`
+    retry_jitter: float = 0.5  # fraction of the delay randomly cut off
+    retry_budget: t.Optional[int] = 500  # total retries per spider; None means no limit
+
+    @property
+    def frontier_kwargs(self) -> t.Dict[str, t.Any]:
+        return {
+            "order": self.page_order,
+            "max_details_queued": self.max_details_queued,
+        }
+
+    @property
+    def concurrency_limiter_kwargs(self) -> t.Dict[str, t.Any]:
+        return {
+            "initial": self.task_limit,
+            "min_limit": self.min_task_limit,
+            "max_limit": self.max_task_limit,
+            "latency_threshold": self.latency_threshold,
+        }
+
+    @property
+    def retry_policy_kwargs(self) -> t.Dict[str, t.Any]:
+        return {
+            "attempts": self.url_retries,
+            "delay": self.retry_delay,
+            "backoff": self.retry_backoff,
+            "max_delay": self.retry_max_delay,
+            "jitter": self.retry_jitter,
+            "budget": self.retry_budget,
+        }
+
+    @property
+    def rate_limiter_kwargs(self) -> t.Dict[str, t.Any]:
+        return {
+            "rate": self.request_rate,
+            "burst": self.request_burst,
+            "min_interval": self.request_delay,
+        }
 
 
 @dataclass
@@ -68,6 +137,10 @@ class RequestPolicy:
     timeout: int = 5
     is_valid: t.Optional[t.Callable[[Response], bool]] = None
     request_kwargs: dict = field(default_factory=dict)
+    max_connections: t.Optional[int] = 10
+    max_keepalive_connections: t.Optional[int] = 5
+    keepalive_expiry: t.Optional[float] = 5.0  # in seconds
+    http2: bool = False
 
     @property
     def headers(self) -> t.Dict[str, str]:
@@ -81,6 +154,76 @@ class RequestPolicy:
             "headers": self.headers,
         }
 
+    @property
+    def pool_kwargs(self) -> t.Dict[str, t.Any]:
+        return {
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "http2": self.http2,
+        }
+
+
+@dataclass
+class CachePolicy:
+    is_enabled: bool = False
+    ttl: t.Optional[timedelta] = timedelta(minutes=50)  # fresh responses are served without revalidation
+    max_size: int = 256 * 1024 * 1024  # in bytes; 0 means unbounded
+
+
+@dataclass
+class UrlPolicy:
+    strip_params: t.Tuple[str, ...] = TRACKING_PARAMS  # shell-style patterns of query params to drop
+    sort_query: bool = True
+    trailing_slash: str = "keep"  # "keep", "strip" or "add"
+
+    @property
+    def canonicalizer_kwargs(self) -> t.Dict[str, t.Any]:
+        return {
+            "strip_params": self.strip_params,
+            "sort_query": self.sort_query,
+            "trailing_slash": self.trailing_slash,
+        }
+
+
+@dataclass
+class CheckpointPolicy:
+    is_enabled: bool = False  # the journal is written on the event loop, so only spiders worth resuming keep it
+    flush_every: int = 500  # changes of URL states written at once
+    bloom_capacity: t.Optional[int] = None  # expected URLs; when given, seen URLs are kept in a Bloom filter
+    bloom_error_rate: float = 0.001  # probability of skipping a new URL as seen
+
+    @property
+    def seen_urls_kwargs(self) -> t.Dict[str, t.Any]:
+        return {
+            "bloom_capacity": self.bloom_capacity,
+            "bloom_error_rate": self.bloom_error_rate,
+        }
+
+
+@dataclass
+class IncrementalPolicy:
+    is_enabled: bool = False
+    max_age: t.Optional[timedelta] = timedelta(days=1)  # pages are extracted again when their fingerprint is older
+    flush_every: int = 100  # fingerprints written at once
+
+
+@dataclass
+class DeadlinePolicy:
+    soft: t.Optional[timedelta] = None  # since the start; URLs in progress are finished, new ones aren't followed
+    hard: t.Optional[timedelta] = None  # since the start; processing is cancelled (at the process timeout at most)
+
+    def get_hard_deadline(self, process_state: ProcessState) -> float:
+        """
+        >>> DeadlinePolicy(hard=timedelta(minutes=5)).get_hard_deadline(ProcessState(timeout=3600))
+        300.0
+        >>> DeadlinePolicy().get_hard_deadline(ProcessState(timeout=3600))
+        3600.0
+        """
+        if self.hard is None:
+            return float(process_state.timeout)
+        return min(self.hard.total_seconds(), process_state.timeout)
+
 
 @dataclass
 class SchedulePolicy:
@@ -102,7 +245,12 @@ class SpiderConfig:
 
     concurrency_policy: ConcurrencyPolicy = ConcurrencyPolicy()
     request_policy: RequestPolicy = RequestPolicy()
+    url_policy: UrlPolicy = UrlPolicy()
     schedule_policy: SchedulePolicy = SchedulePolicy()
+    cache_policy: CachePolicy = CachePolicy()
+    checkpoint_policy: CheckpointPolicy = CheckpointPolicy()
+    incremental_policy: IncrementalPolicy = IncrementalPolicy()
+    deadline_policy: DeadlinePolicy = DeadlinePolicy()
 
     def __post_init__(self) -> None:
         if self.start_urls is None:
@@ -0,0 +1,106 @@
+import asyncio
+from collections import Counter
+import dataclasses
+from datetime import datetime, timedelta
+import signal
+import typing as t
+
+from .caching import ResponseCache
+from .config import ProcessState, SpiderConfig
+from .extraction import Extractor
+from .fetching import ClientPool
+from .signals import SIGNALS
+from .spider import Spider, get_cache, get_client_pool, get_configs
+
+
+def is_same_slot(previous: t.Optional[datetime], now: datetime, interval: timedelta) -> bool:
+    """
+    Tells whether the spider was already considered in the time slot of `now`: slots are `interval` long
+    and a spider's slot comes once a day (see `SpiderConfig.should_start`).
+
+    >>> is_same_slot(datetime(2019, 8, 14, 12, 20), datetime(2019, 8, 14, 12, 30), timedelta(minutes=15))
+    True
+    >>> is_same_slot(datetime(2019, 8, 13, 12, 20), datetime(2019, 8, 14, 12, 30), timedelta(minutes=15))
+    False
+    >>> is_same_slot(None, datetime(2019, 8, 14, 12, 30), timedelta(minutes=15))
+    False
+    """
+    return previous is not None and now - previous <= interval
+
+
+class Daemon:
+    """
+    Keeps the process resident, instead of starting it every `interval` (`--scheduler`): every
+    `process_state.check_interval` it launches the spiders whose time slots have come, in the same event loop.
+    HTTP clients and response caches of the spiders are kept between their runs. A spider still running
+    when its next slot comes isn't started again; `meta:spider_overlapping` is sent instead.
+    Runs until `stop` is called, on SIGINT or SIGTERM, and then waits for the running spiders.
+    """
+
+    def __init__(self, process_state: ProcessState, extractor: Extractor) -> None:
+        self.process_state = dataclasses.replace(process_state, is_scheduler_on=True)
+        self._extractor = extractor
+        self._client_pools: t.Dict[str, ClientPool] = {}
+        self._caches: t.Dict[str, t.Optional[ResponseCache]] = {}
+        self._considered_at: t.Dict[str, datetime] = {}
+        self._running: t.Dict[str, asyncio.Task] = {}
+        self._runs: t.Counter[str] = Counter()
+        self._stopping: t.Optional[asyncio.Event] = None
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {self.process_state.name}>"
+
+    async def run(self) -> t.Tuple[t.List[str], t.Dict[str, t.Any]]:
+        """Returns names of the spiders run and the number of their runs, for `meta:finished`."""
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_event_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.stop)
+        try:
+            while not self._stopping.is_set():
+                self.launch_due(datetime.now())
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.process_state.check_interval)
+                except asyncio.TimeoutError:
+                    pass
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        finally:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(signum)
+            await asyncio.gather(*(pool.aclose() for pool in self._client_pools.values()))
+        return sorted(self._runs), {"runs": dict(self._runs)}
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def launch_due(self, now: datetime) -> None:
+        process_state = dataclasses.replace(self.process_state, start=now)
+        for config in get_configs(process_state):
+            if is_same_slot(self._considered_at.get(config.name), now, process_state.interval):
+                continue
+            self._considered_at[config.name] = now
+            if config.name in self._running:
+                SIGNALS.meta.spider_overlapping.send(process_state, spider=config.name)
+                continue
+            self._launch(config, process_state)
+
+    def _launch(self, config: SpiderConfig, process_state: ProcessState) -> None:
+        if config.name not in self._client_pools:
+            self._client_pools[config.name] = get_client_pool(config)
+            self._caches[config.name] = get_cache(config)
+        spider = Spider(
+            config=config,
+            process_state=process_state,
+            extractor=self._extractor,
+            client_pool=self._client_pools[config.name],
+            cache=self._caches[config.name],
+        )
+        SIGNALS.meta.started.send(process_state, spiders={spider})
+        task = self._running[config.name] = asyncio.create_task(spider.run())
+        task.add_done_callback(lambda task: self._finished(config.name, task, process_state))
+        self._runs[config.name] += 1
+
+    def _finished(self, name: str, task: asyncio.Task, process_state: ProcessState) -> None:
+        del self._running[name]
+        if not task.cancelled() and (error := task.exception()) is not None:
+            SIGNALS.meta.error.send(process_state, error=[error])
@@ -0,0 +1,302 @@
+from datetime import date, datetime
+from inspect import getattr_static
+import json
+from pathlib import Path
+import typing as t
+
+from .config import SpiderConfig
+from .page import Field, PageFragment, PageModel
+from .signals import SIGNALS
+from .storage import Storage, get_changes_table
+
+try:
+    import pyarrow
+    from pyarrow import parquet
+except ImportError:
+    pyarrow = parquet = None
+
+
+# scalar types having columns of their own; anything else is stored as JSON text
+SCALAR_TYPES = (str, int, float, bool, datetime, date, t.Any)
+# types of text columns, taking values of any type (stored as JSON text unless they're strings)
+TEXT_TYPES = (str, t.Any)
+# columns of tables of changes, see `bga.scraping.changes`
+CHANGES_COLUMNS = {"change": str, "key": str, "item": dict}
+NoneType = type(None)
+
+
+def is_available() -> bool:
+    return pyarrow is not None
+
+
+def get_field_type(field: Field) -> t.Any:
+    """
+    Type of the field's values, as annotated on its clean function. Values of unannotated ones can be
+    of any type (or a list of them), they are stored as text.
+    """
+    try:
+        annotation = t.get_type_hints(field._clean).get("return")
+    except Exception:
+        annotation = None
+    if annotation is None:
+        return t.List[t.Any] if field.many else t.Any
+    return annotation
+
+
+def get_columns(fragment_class: t.Type[PageFragment], prefix: str = "") -> t.Dict[str, t.Any]:
+    """
+    Columns of the items of the fragment, with their types. Fields of a nested model are flattened
+    into `<field>.<nested field>` columns; many nested models are kept in a single column.
+
+    >>> from bga.scraping.page import Css
+    >>> from bga.scraping.texttools import clean_money
+    >>> def clean_int(page_fragment, selector_list) -> int:
+    ...     return int(selector_list.get())
+    >>> class Offer(PageFragment):
+    ...     shop = Css('.shop::text')
+    ...     price = Css('.price', clean=clean_money)
+    >>> class Game(PageFragment):
+    ...     name = Css('h1::text')
+    ...     players = Css('.players::text', clean=clean_int)
+    ...     tags = Css('.tag::text', many=True)
+    ...     offer = Css('.offer', model=Offer)
+    ...     offers = Css('.offer', model=Offer, many=True)
+    >>> get_columns(Game) == {
+    ...     'name': t.Any, 'players': int, 'tags': t.List[t.Any],
+    ...     'offer.shop': t.Any, 'offer.price': t.Optional[t.Dict[str, str]], 'offers': t.List[dict],
+    ... }
+    True
+    >>> list(get_columns(Game))
+    ['name', 'players', 'tags', 'offer.shop', 'offer.price', 'offers']
+    """
+    columns = {}
+    for name, field in fragment_class._fields.items():
+        if field.model and not field.many:
+            columns.update(get_columns(field.model, prefix=f"{prefix}{name}."))
+        elif field.model:
+            columns[f"{prefix}{name}"] = t.List[dict]
+        else:
+            columns[f"{prefix}{name}"] = get_field_type(field)
+    return columns
+
+
+def get_item_classes(config: SpiderConfig) -> t.List[t.Type[PageFragment]]:
+    """Fragments of the items extracted by the spider: models of `items` fields or models extracting themselves."""
+    item_classes = []
+    for model_class in (config.start_model, config.catalogue_model, config.details_model):
+        if model_class is None:
+            continue
+        items_field = getattr(model_class, "items", None)
+        if isinstance(items_field, Field) and items_field.model:
+            item_class = items_field.model
+        elif getattr_static(model_class, "extracted") is not getattr_static(PageModel, "extracted"):
+            item_class = model_class
+        else:
+            continue
+        if item_class not in item_classes:
+            item_classes.append(item_class)
+    return item_classes
+
+
+def get_spider_columns(config: SpiderConfig) -> t.Dict[str, t.Any]:
+    columns = {}
+    for item_class in get_item_classes(config):
+        for name, annotation in get_columns(item_class).items():
+            columns.setdefault(name, annotation)
+    return columns
+
+
+def unwrap_optional(annotation: t.Any) -> t.Any:
+    """
+    >>> unwrap_optional(t.Optional[int]), unwrap_optional(str)
+    (<class 'int'>, <class 'str'>)
+    >>> unwrap_optional(t.Union[int, str]) == t.Union[int, str]
+    True
+    """
+    arguments = [a for a in t.get_args(annotation) if a is not NoneType]
+    if t.get_origin(annotation) is t.Union and len(arguments) == 1:
+        return arguments[0]
+    return annotation
+
+
+def is_scalar(annotation: t.Any) -> bool:
+    """
+    >>> is_scalar(t.Optional[float]), is_scalar(t.List[str]), is_scalar(t.List[dict]), is_scalar(dict)
+    (True, True, False, False)
+    >>> is_scalar(t.Any), is_scalar(t.List[t.Any])
+    (True, True)
+    """
+    annotation = unwrap_optional(annotation)
+    if t.get_origin(annotation) is list:
+        (annotation,) = t.get_args(annotation) or (None,)
+    return annotation in SCALAR_TYPES
+
+
+def to_arrow_type(annotation: t.Any) -> "pyarrow.DataType":
+    annotation = unwrap_optional(annotation)
+    if t.get_origin(annotation) is list:
+        return pyarrow.list_(to_arrow_type(t.get_args(annotation)[0]))
+    return {
+        int: pyarrow.int64(),
+        float: pyarrow.float64(),
+        bool: pyarrow.bool_(),
+        datetime: pyarrow.timestamp("us"),
+        date: pyarrow.date32(),
+    }.get(annotation, pyarrow.string())
+
+
+def to_text(value: t.Any) -> str:
+    """
+    >>> to_text('Azul'), to_text(12.5), to_text({'amount': '120'})
+    ('Azul', '12.5', '{"amount": "120"}')
+    """
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+
+
+def fits(value: t.Any, python_type: type) -> bool:
+    """
+    Whether the value can be stored in a column of the (scalar, non-text) type.
+
+    >>> fits(1, float), fits(1.5, int), fits(True, int), fits('1', int), fits(datetime(2020, 1, 1), date)
+    (True, False, False, False, False)
+    """
+    if isinstance(value, bool):
+        return python_type is bool
+    if python_type is float:
+        return isinstance(value, (int, float))
+    if python_type is date:
+        return isinstance(value, date) and not isinstance(value, datetime)
+    return isinstance(value, python_type)
+
+
+def flatten(item: dict, columns: t.Container[str], prefix: str = "") -> dict:
+    """
+    Flattens values of nested models into their columns; other dicts are values of their own columns.
+
+    >>> flatten(
+    ...     {'name': 'Azul', 'offer': {'shop': 'a', 'price': {'amount': '120'}}, 'tags': ['abstract']},
+    ...     columns={'name', 'offer.shop', 'offer.price', 'tags'},
+    ... )
+    {'name': 'Azul', 'offer.shop': 'a', 'offer.price': {'amount': '120'}, 'tags': ['abstract']}
+    """
+    flat = {}
+    for name, value in item.items():
+        column = f"{prefix}{name}"
+        if isinstance(value, dict) and column not in columns:
+            flat.update(flatten(value, columns, prefix=f"{column}."))
+        else:
+            flat[column] = value
+    return flat
+
+
+class TableExporter:
+    """
+    Writes items of a spider to a Parquet file, compressed with zstd, `batch_size` rows at a time.
+    Columns are given (see `get_spider_columns`); values of non-scalar columns are stored as JSON text,
+    so are values other than strings of text columns. Values not fitting the type of their (annotated)
+    column are left empty and counted in `values_dropped`. Needs `pyarrow`.
+    """
+
+    def __init__(self, path: Path, columns: t.Mapping[str, t.Any], batch_size: int = 10000) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self._columns = {name: unwrap_optional(annotation) for name, annotation in columns.items()}
+        self._json_columns = {name for name, annotation in columns.items() if not is_scalar(annotation)}
+        self._schema = pyarrow.schema(
+            [
+                (name, pyarrow.string() if name in self._json_columns else to_arrow_type(annotation))
+                for name, annotation in columns.items()
+            ]
+        )
+        self._batch: t.List[dict] = []
+        self._writer = None
+        self.rows: int = 0
+        self.values_dropped: int = 0
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path})"
+
+    def __enter__(self) -> "TableExporter":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._writer = parquet.ParquetWriter(str(self.path), self._schema, compression="zstd")
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.flush()
+        self._writer.close()
+
+    def write(self, item: dict) -> None:
+        self._batch.append(flatten(item, self._columns))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._batch:
+            return
+        columns = {name: [self._to_value(name, row.get(name)) for row in self._batch] for name in self._schema.names}
+        self._writer.write_table(pyarrow.Table.from_pydict(columns, schema=self._schema))
+        self.rows += len(self._batch)
+        self._batch.clear()
+
+    def _to_value(self, name: str, value: t.Any) -> t.Any:
+        if value is None:
+            return None
+        if name in self._json_columns:
+            return json.dumps(value, ensure_ascii=False, default=str)
+        annotation = self._columns[name]
+        if t.get_origin(annotation) is not list:
+            return self._to_scalar(value, annotation)
+        if not isinstance(value, list):
+            self.values_dropped += 1
+            return None
+        (annotation,) = t.get_args(annotation)
+        return [self._to_scalar(item, annotation) for item in value]
+
+    def _to_scalar(self, value: t.Any, python_type: t.Any) -> t.Any:
+        if value is None:
+            return None
+        if python_type in TEXT_TYPES:
+            return to_text(value)
+        if fits(value, python_type):
+            return value
+        self.values_dropped += 1
+        return None
+
+
+def export_run(storage: Storage, configs: t.Iterable[SpiderConfig], directory: Path) -> t.Dict[str, Path]:
+    """
+    Exports tables of the spiders written in the run, each to `<directory>/<table>.parquet`,
+    streaming the items from the storage: items of a spider and changes of them (`<spider>.changes`).
+    Returns paths of the files.
+    """
+    paths = {}
+    for config in configs:
+        tables = {config.name: get_spider_columns(config), get_changes_table(config.name): CHANGES_COLUMNS}
+        for table, columns in tables.items():
+            if table not in storage.tables:
+                continue
+            path = directory / f"{table}.parquet"
+            with TableExporter(path, columns) as exporter:
+                for item in storage.read(table):
+                    exporter.write(item)
+            SIGNALS.output.table_exported.send(
+                storage, table=table, rows=exporter.rows, values_dropped=exporter.values_dropped, path=path
+            )
+            paths[table] = path
+    return paths
+
+
+def read_table(path: Path, columns: t.Optional[t.Sequence[str]] = None) -> "pyarrow.Table":
+    """Loads an exported table (or only some of its columns); `.to_pandas()` makes it a data frame."""
+    return parquet.read_table(str(path), columns=columns)
+
+
+def read_run(directory: Path, columns: t.Optional[t.Sequence[str]] = None) -> t.Dict[str, "pyarrow.Table"]:
+    """Loads all the tables exported for a run, by the names of their spiders."""
+    return {path.stem: read_table(path, columns) for path in sorted(directory.glob("*.parquet"))}
+
+
+def iter_rows(path: Path, batch_size: int = 10000) -> t.Iterator[dict]:
+    """Rows of an exported table, one batch in memory at a time."""
+    for batch in parquet.ParquetFile(str(path)).iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
@@ -0,0 +1,103 @@
+import asyncio
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from dataclasses import dataclass, field
+import functools
+import typing as t
+
+from pca.utils.imports import import_dotted_path
+
+from bga.common.urls import Url
+from .page import ItemRecord, PageMetadata, PageModel
+
+
+EXECUTORS: t.Dict[str, t.Type[Executor]] = {
+    "process": ProcessPoolExecutor,
+    "thread": ThreadPoolExecutor,
+}
+
+
+@dataclass
+class ExtractionResult:
+    """Picklable outcome of parsing a page with its model."""
+
+    is_valid: bool
+    items: t.List[t.Union[dict, ItemRecord]] = field(default_factory=list)
+    catalogue_urls: t.List[Url] = field(default_factory=list)
+    details_urls: t.List[Url] = field(default_factory=list)
+
+
+def get_model_path(model_class: t.Type[PageModel]) -> str:
+    """
+    >>> get_model_path(PageModel)
+    'bga.scraping.page:PageModel'
+    """
+    return f"{model_class.__module__}:{model_class.__qualname__}"
+
+
+def extract(
+    model_path: str, body: bytes, encoding: t.Optional[str], metadata: t.Optional[PageMetadata]
+) -> ExtractionResult:
+    """
+    Parses the page and evaluates all the fields of its model. Runs in a worker of the executor,
+    so it gets the model by its import path and returns only plain data. The body retained
+    in the metadata is released afterwards.
+
+    >>> html = b"<html><body><div class='navigation'><a href='/a'>A</a></div></body></html>"
+    >>> extract('bga.scraping.example:CataloguePage', html, 'utf-8', metadata=None)
+    ExtractionResult(is_valid=True, items=[{'title': 'A', 'url': '/a'}], catalogue_urls=[], details_urls=[])
+    """
+    model_class: t.Type[PageModel] = import_dotted_path(model_path)
+    model = model_class.from_body(body, encoding, metadata=metadata)
+    try:
+        if not model.is_valid_response():
+            return ExtractionResult(is_valid=False)
+        return ExtractionResult(
+            is_valid=True,
+            items=model.extracted,
+            catalogue_urls=list(model.catalogue_urls),
+            details_urls=list(model.details_urls),
+        )
+    finally:
+        if metadata is not None:
+            metadata.release()
+
+
+class Extractor:
+    """
+    Runs page extraction in a pool of processes or threads, so that parsing doesn't block the event loop.
+    Without an executor type, extraction runs inline on the loop.
+    """
+
+    def __init__(self, executor_type: t.Optional[str] = None, max_workers: t.Optional[int] = None) -> None:
+        self.executor_type = executor_type
+        self._executor: t.Optional[Executor] = (
+            EXECUTORS[executor_type](max_workers=max_workers) if executor_type else None
+        )
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.executor_type})"
+
+    async def extract(
+        self, model_class: t.Type[PageModel], body: bytes, encoding: t.Optional[str], metadata: PageMetadata
+    ) -> ExtractionResult:
+        model_path = get_model_path(model_class)
+        if self._executor is None:
+            return extract(model_path, body, encoding, metadata)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(extract, model_path, body, encoding, metadata)
+        )
+
+    async def __aenter__(self) -> "Extractor":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
@@ -1,27 +1,166 @@
 import asyncio
+from contextlib import asynccontextmanager
+import functools
 import typing as t
 
+import httpcore
 from httpx import (
     AsyncClient,
     Response,
+    TimeoutException,
+    create_ssl_context,
 )
 
-from bga.common.urls import Url
+from bga.common.urls import Url, get_host_from_url
+from .caching import ResponseCache
 from .page import PageFragment
+from .throttling import AdaptiveLimiter, RateLimiter
 
 
-async def fetch(url: Url, client_kwargs: dict = None, request_kwargs: dict = None) -> Response:
-    # TODO HTTP Client cache
+class CountingConnectionPool(httpcore.AsyncConnectionPool):
+    """Connection pool which counts requests and newly opened connections to measure keep-alive reuse."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests_sent: int = 0
+        self.connections_opened: int = 0
+
+    async def request(self, *args, **kwargs):
+        self.requests_sent += 1
+        return await super().request(*args, **kwargs)
+
+    async def _add_to_pool(self, *args, **kwargs) -> None:
+        self.connections_opened += 1
+        await super()._add_to_pool(*args, **kwargs)
+
+
+class ClientPool:
+    """
+    Long-lived HTTP clients, one per host, reused by all requests of their owner.
+
+    >>> pool = ClientPool()
+    >>> pool.stats()
+    {'hosts': 0, 'requests_sent': 0, 'connections_opened': 0, 'reuse_ratio': 0.0}
+    """
+
+    def __init__(
+        self,
+        client_kwargs: dict = None,
+        max_connections: t.Optional[int] = None,
+        max_keepalive_connections: t.Optional[int] = None,
+        keepalive_expiry: t.Optional[float] = None,
+        http2: bool = False,
+    ) -> None:
+        self._client_kwargs = client_kwargs or {}
+        self._pool_kwargs = dict(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+            http2=http2,
+        )
+        self._http2 = http2
+        self._clients: t.Dict[str, AsyncClient] = {}
+        self._transports: t.List[CountingConnectionPool] = []
+
+    def get(self, url: Url) -> AsyncClient:
+        host = get_host_from_url(url)
+        if (client := self._clients.get(host)) is None:
+            transport = CountingConnectionPool(ssl_context=create_ssl_context(http2=self._http2), **self._pool_kwargs)
+            client = AsyncClient(transport=transport, http2=self._http2, **self._client_kwargs)
+            self._clients[host] = client
+            self._transports.append(transport)
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        await asyncio.gather(*(client.aclose() for client in clients.values()))
+
+    async def __aenter__(self) -> "ClientPool":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        requests_sent = sum(transport.requests_sent for transport in self._transports)
+        connections_opened = sum(transport.connections_opened for transport in self._transports)
+        reuse_ratio = 1 - connections_opened / requests_sent if requests_sent else 0.0
+        return {
+            "hosts": len(self._transports),
+            "requests_sent": requests_sent,
+            "connections_opened": connections_opened,
+            "reuse_ratio": round(reuse_ratio, 3),
+        }
+
+
+async def fetch(
+    url: Url,
+    client_kwargs: dict = None,
+    request_kwargs: dict = None,
+    client: AsyncClient = None,
+    cache: ResponseCache = None,
+) -> Response:
+    if cache is not None:
+        uncached_fetch = functools.partial(fetch, client_kwargs=client_kwargs, client=client)
+        return await cache.fetch(url, uncached_fetch, request_kwargs)
+    if client is not None:
+        return await client.get(url, **request_kwargs or {})
     async with AsyncClient(**client_kwargs or {}) as client:
         response = await client.get(url, **request_kwargs or {})
     return response
 
 
+def is_congested(response: Response) -> bool:
+    """Tells whether the response signals that the server is overloaded or throttles us."""
+    return response.status_code == 429 or response.status_code >= 500
+
+
 async def bound_fetch(
-    semaphore: asyncio.Semaphore, url: Url, client_kwargs: dict = None, request_kwargs: dict = None
+    limiter: AdaptiveLimiter,
+    url: Url,
+    client_kwargs: dict = None,
+    request_kwargs: dict = None,
+    client: AsyncClient = None,
+    rate_limiter: RateLimiter = None,
+    cache: ResponseCache = None,
 ) -> Response:
-    async with semaphore:
-        return await fetch(url, client_kwargs, request_kwargs)
+    # fresh responses are served from the disk, without waiting for slots and not telling anything about the server
+    if cache is not None and (response := await cache.fetch_fresh(url)) is not None:
+        return response
+    # waiting for the rate slot doesn't hold a concurrency slot
+    if rate_limiter is not None:
+        await rate_limiter.acquire()
+    async with limiter:
+        started = limiter.clock()
+        try:
+            response = await fetch(url, client_kwargs, request_kwargs, client=client, cache=cache)
+        except TimeoutException:
+            limiter.record(started, is_congested=True)
+            raise
+        limiter.record(started, is_congested=is_congested(response))
+        return response
+
+
+@asynccontextmanager
+async def bound_stream(
+    limiter: AdaptiveLimiter,
+    url: Url,
+    client: AsyncClient,
+    request_kwargs: dict = None,
+    rate_limiter: RateLimiter = None,
+) -> t.AsyncIterator[Response]:
+    """Like `bound_fetch`, but yields the response as soon as its headers arrive, with the body to be streamed."""
+    if rate_limiter is not None:
+        await rate_limiter.acquire()
+    async with limiter:
+        started = limiter.clock()
+        try:
+            async with client.stream("GET", url, **request_kwargs or {}) as response:
+                limiter.record(started, is_congested=is_congested(response))
+                yield response
+        except TimeoutException:
+            limiter.record(started, is_congested=True)
+            raise
 
 
 async def fetch_item(
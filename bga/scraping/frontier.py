@@ -0,0 +1,184 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+import heapq
+import itertools
+import typing as t
+
+from bga.common.urls import Url
+from .page import PageModel
+from .signals import SIGNALS
+
+
+# "details_first" is depth-first: items of a catalogue page come before the next catalogue pages
+PAGE_ORDERS = ("discovery", "details_first", "catalogue_first")
+
+
+@dataclass(order=True)
+class FrontierEntry:
+    """URL waiting to be processed; entries with lower `priority` go first, in FIFO order within a priority."""
+
+    priority: int
+    sequence: int
+    url: Url = field(compare=False)
+    model_class: t.Type[PageModel] = field(compare=False)
+    attempt: int = field(default=0, compare=False)
+    is_details: bool = field(default=False, compare=False)
+
+
+class Frontier:
+    """
+    Priority queue of URLs drained by a fixed number of worker coroutines.
+
+    Catalogue and details pages are queued separately; `order` tells which go first: in the order of their
+    priorities and discovery, details or catalogue pages. Catalogue pages find new details pages, so with
+    `max_details_queued` they are held back (and `spider:catalogue_held` is sent) while that many details
+    pages wait, which bounds the queue and brings the first items sooner.
+
+    An entry is unfinished from its push until the worker marks it done (or, for delayed pushes, since
+    the push is scheduled). Workers waiting for entries are woken up as soon as the frontier drains,
+    i.e. nothing is queued and nothing is unfinished, and `pop` returns None to each of them.
+    A closed frontier drops queued entries and doesn't accept new ones; popped entries are still finished.
+
+    >>> async def crawl():
+    ...     frontier, processed = Frontier(), []
+    ...     async def work():
+    ...         while (entry := await frontier.pop()) is not None:
+    ...             processed.append(entry.url)
+    ...             if entry.url == 'a':
+    ...                 frontier.push('c', PageModel, priority=1)
+    ...                 frontier.push('d', PageModel)
+    ...             frontier.done()
+    ...     frontier.push('b', PageModel, priority=1)
+    ...     frontier.push('a', PageModel)
+    ...     await asyncio.gather(work(), work())
+    ...     return processed
+    >>> asyncio.get_event_loop().run_until_complete(crawl())
+    ['a', 'd', 'b', 'c']
+
+    >>> async def pop_all(frontier):
+    ...     return [(await frontier.pop()).url for _ in range(len(frontier))]
+    >>> frontier = Frontier(order='details_first')
+    >>> for url, is_details in [('c1', False), ('c2', False), ('d1', True), ('d2', True)]:
+    ...     frontier.push(url, PageModel, is_details=is_details)
+    >>> asyncio.get_event_loop().run_until_complete(pop_all(frontier))
+    ['d1', 'd2', 'c1', 'c2']
+    >>> frontier = Frontier(max_details_queued=2)
+    >>> for url, is_details in [('c1', False), ('d1', True), ('c2', False), ('d2', True), ('d3', True)]:
+    ...     frontier.push(url, PageModel, is_details=is_details)
+    >>> asyncio.get_event_loop().run_until_complete(pop_all(frontier))
+    ['d1', 'd2', 'c1', 'c2', 'd3']
+
+    >>> frontier = Frontier()
+    >>> frontier.push('a', PageModel)
+    >>> frontier.close(), frontier.push('b', PageModel), frontier.is_drained
+    (1, None, True)
+    """
+
+    def __init__(self, order: str = "discovery", max_details_queued: t.Optional[int] = None, owner: t.Any = None):
+        if order not in PAGE_ORDERS:
+            raise ValueError(f"order has to be one of {PAGE_ORDERS}, not {order!r}")
+        self.order = order
+        self.max_details_queued = max_details_queued
+        self.owner = owner
+        self._catalogue: t.List[FrontierEntry] = []
+        self._details: t.List[FrontierEntry] = []
+        self._is_holding_catalogue: bool = False
+        self._sequence = itertools.count()
+        self._unfinished: int = 0
+        self._waiters: t.Deque[asyncio.Future] = deque()
+        self.is_closed: bool = False
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} queued={len(self)} unfinished={self._unfinished}>"
+
+    def __len__(self) -> int:
+        return len(self._catalogue) + len(self._details)
+
+    def depths(self) -> t.Dict[str, int]:
+        return {"queued": len(self), "queued_catalogue": len(self._catalogue), "queued_details": len(self._details)}
+
+    @property
+    def unfinished(self) -> int:
+        return self._unfinished
+
+    @property
+    def is_drained(self) -> bool:
+        return not self._catalogue and not self._details and not self._unfinished
+
+    def push(
+        self,
+        url: Url,
+        model_class: t.Type[PageModel],
+        priority: int = 0,
+        attempt: int = 0,
+        delay: float = 0.0,
+        is_details: bool = False,
+    ) -> None:
+        """Queues the URL; with a `delay` (in seconds) the URL is queued later, but counts as unfinished already."""
+        if self.is_closed:
+            return
+        entry = FrontierEntry(priority, next(self._sequence), url, model_class, attempt, is_details)
+        self._unfinished += 1
+        if delay > 0:
+            asyncio.get_event_loop().call_later(delay, self._put, entry)
+        else:
+            self._put(entry)
+
+    async def pop(self) -> t.Optional[FrontierEntry]:
+        """Waits for the next entry; returns None when the frontier is drained."""
+        while not (heap := self._choose()):
+            if not self._unfinished:
+                return None
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        return heapq.heappop(heap)
+
+    def done(self) -> None:
+        """Marks a popped entry as processed."""
+        self._unfinished -= 1
+        if not self._unfinished:
+            self._wake(everyone=True)
+
+    def close(self) -> int:
+        """Stops accepting entries and drops the queued ones; returns how many were dropped."""
+        self.is_closed = True
+        dropped = len(self)
+        self._catalogue.clear()
+        self._details.clear()
+        self._unfinished -= dropped
+        if not self._unfinished:
+            self._wake(everyone=True)
+        return dropped
+
+    def _put(self, entry: FrontierEntry) -> None:
+        if self.is_closed:
+            # a delayed entry
+            self.done()
+            return
+        heapq.heappush(self._details if entry.is_details else self._catalogue, entry)
+        self._wake()
+
+    def _choose(self) -> t.Optional[t.List[FrontierEntry]]:
+        """Tells which queue the next entry comes from; None if both are empty."""
+        catalogue, details = self._catalogue, self._details
+        if not catalogue or not details:
+            return catalogue or details or None
+        is_holding = self.max_details_queued is not None and len(details) >= self.max_details_queued
+        if is_holding and not self._is_holding_catalogue:
+            SIGNALS.spider.catalogue_held.send(self.owner or self, **self.depths())
+        self._is_holding_catalogue = is_holding
+        if is_holding or self.order == "details_first":
+            return details
+        if self.order == "catalogue_first":
+            return catalogue
+        return min(catalogue, details, key=lambda heap: heap[0])
+
+    def _wake(self, everyone: bool = False) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                if not everyone:
+                    return
@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import hashlib
+import json
+from pathlib import Path
+import re
+import sqlite3
+import typing as t
+
+from bga.common.urls import Url
+from .checkpointing import url_fingerprint
+
+
+WHITESPACE = re.compile(rb"\s+")
+
+
+def content_fingerprint(body: bytes, ignored: t.Sequence[t.Union[bytes, t.Pattern[bytes]]] = ()) -> int:
+    """
+    Signed 64-bit fingerprint of the body, with whitespace normalized and `ignored` patterns
+    (like timestamps or tokens changing on every request) removed.
+
+    >>> content_fingerprint(b'<p>Price:\\n  10 PLN</p>') == content_fingerprint(b'<p>Price: 10 PLN</p>')
+    True
+    >>> token = rb'token="\\w+"'
+    >>> content_fingerprint(b'<p token="a1">', [token]) == content_fingerprint(b'<p token="b2">', [token])
+    True
+    """
+    for pattern in ignored:
+        body = re.sub(pattern, b"", body)
+    body = WHITESPACE.sub(b" ", body).strip()
+    return int.from_bytes(hashlib.blake2b(body, digest_size=8).digest(), "big", signed=True)
+
+
+@dataclass
+class PageFingerprint:
+    fingerprint: int
+    catalogue_urls: t.List[Url]
+    details_urls: t.List[Url]
+    stored_at: float  # timestamp
+
+
+class FingerprintStore:
+    """
+    Content fingerprints of pages extracted by previous runs of a spider, with the URLs the pages linked to,
+    in an SQLite file. Fingerprints older than `max_age` are disregarded, so that every page is extracted
+    again from time to time. Writes are buffered and flushed every `flush_every` pages.
+
+    >>> store = FingerprintStore(Path(':memory:'), max_age=timedelta(hours=1))
+    >>> store.store(Url('https://example.com/a'), 42, [Url('https://example.com/b')], [], now=1000.0)
+    >>> store.get(Url('https://example.com/a'), now=1060.0)
+    PageFingerprint(fingerprint=42, catalogue_urls=['https://example.com/b'], details_urls=[], stored_at=1000.0)
+    >>> store.get(Url('https://example.com/a'), now=5000.0) is None
+    True
+    """
+
+    def __init__(self, path: Path, max_age: t.Optional[timedelta] = None, flush_every: int = 100) -> None:
+        self.path = path
+        self.max_age = max_age
+        self.flush_every = flush_every
+        if path.name != ":memory:":
+            path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(path))
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages (url_fingerprint INTEGER PRIMARY KEY, fingerprint INTEGER, "
+            "catalogue_urls TEXT, details_urls TEXT, stored_at REAL)"
+        )
+        self._pending: t.Dict[int, tuple] = {}
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path})"
+
+    def get(self, url: Url, now: t.Optional[float] = None) -> t.Optional[PageFingerprint]:
+        key = url_fingerprint(url)
+        row = self._pending.get(key) or self._connection.execute(
+            "SELECT * FROM pages WHERE url_fingerprint = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        _, fingerprint, catalogue_urls, details_urls, stored_at = row
+        now = now or datetime.now().timestamp()
+        if self.max_age is not None and now - stored_at > self.max_age.total_seconds():
+            return None
+        return PageFingerprint(fingerprint, json.loads(catalogue_urls), json.loads(details_urls), stored_at)
+
+    def store(
+        self,
+        url: Url,
+        fingerprint: int,
+        catalogue_urls: t.Sequence[Url],
+        details_urls: t.Sequence[Url],
+        now: t.Optional[float] = None,
+    ) -> None:
+        key = url_fingerprint(url)
+        now = now or datetime.now().timestamp()
+        self._pending[key] = (key, fingerprint, json.dumps(list(catalogue_urls)), json.dumps(list(details_urls)), now)
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)", self._pending.values())
+        self._pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
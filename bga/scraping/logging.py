@@ -28,19 +28,33 @@ class LogManager:
     SIGNAL_TO_LEVEL: t.Dict[str, str] = {
         "meta:spider_registered": "DEBUG",
         "meta:started": "INFO",
+        "meta:spider_overlapping": "WARNING",
         "meta:error": "ERROR",
         "meta:finished": "INFO",
         "output:items_extracted": "DEBUG",
+        "output:items_changed": "INFO",
+        "output:items_written": "DEBUG",
+        "output:storage_backlogged": "WARNING",
+        "output:storage_caught_up": "INFO",
+        "output:table_exported": "INFO",
         "output:url_failed": "WARNING",
         "output:url_response_valid": "INFO",
         "output:url_response_invalid": "WARNING",
         "spider:spider_started": "INFO",
+        "spider:spider_resumed": "INFO",
         "spider:spider_ticked": "DEBUG",
         "spider:url_registered": "DEBUG",
         "spider:url_processing_started": "DEBUG",
         "spider:url_fetching_started": "DEBUG",
         "spider:url_fetched": "DEBUG",
+        "spider:url_cache_hit": "DEBUG",
+        "spider:url_cache_miss": "DEBUG",
+        "spider:url_unchanged": "DEBUG",
         "spider:url_error": "INFO",
+        "spider:url_retry_scheduled": "DEBUG",
+        "spider:catalogue_held": "DEBUG",
+        "spider:concurrency_adjusted": "DEBUG",
+        "spider:spider_draining": "WARNING",
         "spider:spider_ended": "INFO",
     }
     LEVEL_TO_COLOR: t.Dict[str, str] = {
@@ -111,7 +125,9 @@ class LogManager:
             method = getattr(logger, level.lower())
             msg = {"asignal": signal.name, "sender": serialize_value(sender), **serialize_kwargs(kwargs)}
             logging_task = method(msg)
+            # finished tasks are released right away, not kept until the end of the process
             self._tasks.add(logging_task)
+            logging_task.add_done_callback(self._tasks.discard)
             return logging_task
 
         signal.connect(logging_function, weak=False)
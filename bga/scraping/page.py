@@ -1,8 +1,12 @@
 import dataclasses
+import functools
+import re
 import typing as t
 from inspect import isawaitable
 
+from lxml import etree
 from parsel import Selector, SelectorList
+from parsel.csstranslator import HTMLTranslator
 from pca.data.descriptors import reify
 
 from bga.common.exceptions import BgaException
@@ -19,13 +23,88 @@ class IgnoreThisItem(BgaException):
     pass
 
 
+_css_translator = HTMLTranslator()
+
+
+@functools.lru_cache(maxsize=None)
+def compile_xpath(xpath: str) -> etree.XPath:
+    """
+    Compiles the expression once; fields declaring the same expression share the compiled query.
+
+    >>> compile_xpath('//a/@href') is compile_xpath('//a/@href')
+    True
+    """
+    return etree.XPath(xpath, namespaces=Selector._default_namespaces, smart_strings=False)
+
+
+def compile_css(css_selector: str) -> etree.XPath:
+    """
+    >>> compile_css('div p a::attr(href)').path
+    'descendant-or-self::div/descendant-or-self::*/p/descendant-or-self::*/a/@href'
+    """
+    return compile_xpath(_css_translator.css_to_xpath(css_selector))
+
+
+def select(query: etree.XPath, selector: Selector) -> SelectorList:
+    """
+    Evaluates a compiled query the same way `Selector.xpath` evaluates an expression.
+
+    >>> select(compile_css('a::text'), Selector(text="<a href='#'>foo</a><a>bar</a>")).getall()
+    ['foo', 'bar']
+    """
+    try:
+        result = query(selector.root)
+    except TypeError:
+        # the selected node is a text or an attribute value, there's nothing to query within
+        return SelectorList([])
+    if type(result) is not list:
+        result = [result]
+    return SelectorList(
+        [Selector(root=x, _expr=query.path, namespaces=selector.namespaces, type=selector.type) for x in result]
+    )
+
+
 @dataclasses.dataclass
 class PageMetadata:
-    """Describes data about the page, passed from the spider task, other than the HTML itself."""
+    """
+    Describes data about the page, passed from the spider task, other than the HTML itself.
+    The raw body is retained only for models asking for it and is decoded on demand.
+
+    >>> metadata = PageMetadata(url='https://example.com', domain='https://example.com', body='<p>ł</p>'.encode())
+    >>> metadata.source_html
+    '<p>ł</p>'
+    >>> metadata.release()
+    >>> metadata.source_html is None
+    True
+    """
 
     url: Url
     domain: Url
-    source_html: str
+    body: t.Optional[bytes] = None
+    encoding: t.Optional[str] = None
+
+    @property
+    def source_html(self) -> t.Optional[str]:
+        if self.body is None:
+            return None
+        return self.body.decode(self.encoding or "utf-8", errors="replace")
+
+    def release(self) -> None:
+        self.body = None
+
+
+def create_root(body: bytes, encoding: t.Optional[str] = None) -> etree._Element:
+    """
+    Parses the raw body right away, without decoding it to a string first (as `Selector(text=...)` does).
+
+    >>> create_root('<p>ł</p>'.encode('iso-8859-2'), encoding='iso-8859-2').xpath('//p/text()')
+    ['ł']
+    """
+    parser = etree.HTMLParser(recover=True, encoding=encoding)
+    root = etree.fromstring(body.strip().replace(b"\x00", b"") or b"<html/>", parser=parser)
+    if root is None:
+        root = etree.fromstring(b"<html/>", parser=parser)
+    return root
 
 
 class Field:
@@ -69,24 +148,41 @@ class Field:
     ) -> t.Union["Field", ValueOrModel]:
         if page_fragment is None:
             return self
-        value = self._get_value(page_fragment)
-        page_fragment.__dict__[self.name] = value
+        return self.get_value(page_fragment)
+
+    def get_value(self, page_fragment: "PageFragment") -> ValueOrModel:
+        """Evaluates the field once per fragment; next calls return the value cached on the fragment."""
+        try:
+            return page_fragment._values[self.name]
+        except KeyError:
+            pass
+        value = page_fragment._values[self.name] = self._get_value(page_fragment)
+        page_fragment.evaluations += 1
+        return value
+
+    async def async_get_value(self, page_fragment: "PageFragment") -> ValueOrModel:
+        try:
+            return page_fragment._values[self.name]
+        except KeyError:
+            pass
+        value = page_fragment._values[self.name] = await self._async_get_value(page_fragment)
+        page_fragment.evaluations += 1
         return value
 
     def to_value(self, page_fragment: "PageFragment") -> Value:
         if self.many and self.model:
-            return [m.to_dict() for m in self._get_value(page_fragment)]
+            return [m.to_dict() for m in self.get_value(page_fragment)]
         if self.model:
-            return self._get_value(page_fragment).to_dict()
-        return self._get_value(page_fragment)
+            return self.get_value(page_fragment).to_dict()
+        return self.get_value(page_fragment)
 
     async def async_to_value(self, page_fragment: "PageFragment"):
         if self.many and self.model:
-            return [await m.async_to_dict() for m in await self._async_get_value(page_fragment)]
+            return [await m.async_to_dict() for m in await self.async_get_value(page_fragment)]
         if self.model:
-            instance = await self._async_get_value(page_fragment)
+            instance = await self.async_get_value(page_fragment)
             return await instance.async_to_dict()
-        return await self._async_get_value(page_fragment)
+        return await self.async_get_value(page_fragment)
 
     def _get_value(self, page_fragment: "PageFragment") -> ValueOrModel:
         # TODO research for async interface for Selector
@@ -113,24 +209,27 @@ class Field:
 class XPath(Field):
     def __init__(self, xpath: str, **kwargs):
         self.xpath = xpath
+        self.query = compile_xpath(xpath)
         super().__init__(**kwargs)
 
     def _get_selector(self, page_fragment: "PageFragment") -> SelectorList:
-        return page_fragment.selector.xpath(self.xpath)
+        return select(self.query, page_fragment.selector)
 
 
 class Css(Field):
     def __init__(self, css_selector: str, **kwargs):
         self.css_selector = css_selector
+        self.query = compile_css(css_selector)
         super().__init__(**kwargs)
 
     def _get_selector(self, page_fragment: "PageFragment") -> SelectorList:
-        return page_fragment.selector.css(self.css_selector)
+        return select(self.query, page_fragment.selector)
 
 
 class Re(Field):
     def __init__(self, regex: str, *, clean: t.Callable = None, many: bool = False, **kwargs):
         self.regex = regex
+        self.pattern = re.compile(regex)
         if not clean:
             if many:
                 clean = lambda _, selected: selected
@@ -139,7 +238,7 @@ class Re(Field):
         super().__init__(clean=clean, many=many, **kwargs)
 
     def _get_selector(self, page_fragment: "PageFragment") -> SelectorList:
-        return page_fragment.selector.re(self.regex)
+        return page_fragment.selector.re(self.pattern)
 
 
 class Metadata(Field):
@@ -175,6 +274,44 @@ class Noop(Field):
         return self._clean(page_fragment, page_fragment.selector)
 
 
+class ItemRecord:
+    """
+    Base of compact records holding only the values extracted from a fragment, without its selector,
+    metadata or cache. Record classes (with `__slots__` of the fragment's fields) are generated
+    by `PageFragment.record_class`.
+    """
+
+    __slots__ = ()
+    _names: t.Tuple[str, ...] = ()
+    _fragment_class: t.Type["PageFragment"]
+
+    def __init__(self, *values: Value) -> None:
+        for name, value in zip(self._names, values):
+            setattr(self, name, value)
+
+    @property
+    def values(self) -> t.Tuple[Value, ...]:
+        return tuple(getattr(self, name) for name in self._names)
+
+    def to_dict(self) -> dict:
+        return dict(zip(self._names, self.values))
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and self.values == other.values
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{name}={value!r}" for name, value in zip(self._names, self.values))
+        return f"{self.__class__.__name__}({values})"
+
+    def __reduce__(self):
+        # generated classes can't be pickled by reference, their fragment classes can
+        return _restore_record, (self._fragment_class, self.values)
+
+
+def _restore_record(fragment_class: t.Type["PageFragment"], values: t.Tuple[Value, ...]) -> ItemRecord:
+    return fragment_class.record_class()(*values)
+
+
 class PageFragment:
     """
     >>> html = (
@@ -221,10 +358,23 @@ class PageFragment:
               {'a': 'image3.html', 'image': 'image3_thumb.jpg'}],
     'mylink': {'a': 'image1.html', 'image': 'image1_thumb.jpg'},
     'links': ['<img src="image1_thumb.jpg">', '<img src="image2_thumb.jpg">', '<img src="image3_thumb.jpg">']}
+
+    Each field is evaluated once per fragment, whether it's read as an attribute or serialized
+    >>> page = ThePage(html)
+    >>> page.title
+    'Example website'
+    >>> _ = page.to_dict()
+    >>> page.evaluations, page.mylinks[0].evaluations
+    (4, 2)
+    >>> page.invalidate('title')
+    >>> _ = page.to_dict()
+    >>> page.evaluations
+    5
     """
 
     _fields: t.Dict[str, t.Optional[Field]] = {}
     to_be_ignored: bool = False
+    evaluations: int = 0  # how many times fields of the fragment were evaluated
 
     def __init__(
         self,
@@ -233,12 +383,20 @@ class PageFragment:
         fields: t.Mapping[str, Field] = None,
         metadata: PageMetadata = None,
     ):
-        self.html = text
         self.selector = selector or Selector(text=text)
         self.metadata = metadata
+        self._values: t.Dict[str, ValueOrModel] = {}
         if fields:
             self._fields = {**self._fields, **fields}
 
+    @classmethod
+    def from_body(cls, body: bytes, encoding: t.Optional[str] = None, **kwargs) -> "PageFragment":
+        return cls(selector=Selector(root=create_root(body, encoding), type="html"), **kwargs)
+
+    @property
+    def html(self) -> str:
+        return self.selector.get()
+
     def __init_subclass__(cls):
         super().__init_subclass__()
         cls._fields = {k: v for k, v in cls.__dict__.items() if isinstance(v, Field) and not v.excluded}
@@ -246,6 +404,45 @@ class PageFragment:
     def get_field(self, name):
         return self._fields[name]
 
+    def invalidate(self, *names: str) -> None:
+        """Drops cached values of the named fields (or of all the fields), so that they are evaluated again."""
+        if names:
+            for name in names:
+                self._values.pop(name, None)
+        else:
+            self._values.clear()
+
+    @classmethod
+    def record_class(cls) -> t.Type[ItemRecord]:
+        """
+        >>> class Link(PageFragment):
+        ...     title = Css('a::text')
+        ...     url = Css('a::attr(href)')
+        >>> record = Link("<a href='/a'>A</a>").to_record()
+        >>> record, record.__slots__
+        (LinkRecord(title='A', url='/a'), ('title', 'url'))
+        >>> record.to_dict()
+        {'title': 'A', 'url': '/a'}
+        >>> Link.record_class() is type(record)
+        True
+        """
+        if (record_class := cls.__dict__.get("_record_class")) is None:
+            names = tuple(cls._fields)
+            record_class = type(
+                f"{cls.__name__}Record",
+                (ItemRecord,),
+                {"__slots__": names, "_names": names, "_fragment_class": cls, "__module__": cls.__module__},
+            )
+            cls._record_class = record_class
+        return record_class
+
+    def to_record(self) -> t.Optional[ItemRecord]:
+        """Extracts the values into a compact record (None for ignored or empty items) and drops the selector."""
+        values = self.to_dict()
+        self.selector = None
+        self._values.clear()
+        return self.record_class()(*values.values()) if values else None
+
     def to_dict(self) -> dict:
         try:
             return {k: f.to_value(self) for k, f in self._fields.items()}
@@ -267,14 +464,50 @@ class PageModel(PageFragment):
     catalogue_urls: t.Sequence[Url] = ()
     details_urls: t.Sequence[Url] = ()
     items: t.Sequence[PageFragment] = ()
+    # streamed pages are parsed while being downloaded and their items are extracted as soon as they appear,
+    # without keeping them in the tree; see `bga.scraping.streaming.ItemStream`
+    is_streamed: bool = False
+    # whether the raw body should be kept in the metadata for fields reading `source_html`
+    retains_body: bool = False
+    # whether items are extracted into compact records instead of dicts, see `ItemRecord`
+    compact_items: bool = False
+    # patterns of parts of the body (like timestamps or tokens) not telling whether the page changed,
+    # see `bga.scraping.incremental`
+    fingerprint_ignored: t.Sequence[bytes] = ()
+    # name of the field identifying an item across runs (like its URL), for storages updating items in place,
+    # see `bga.scraping.storage.SqliteStorage`
+    item_key: t.Optional[str] = None
 
     def is_valid_response(self) -> bool:
         return True
 
     @reify
-    def extracted(self) -> t.List[dict]:
+    def extracted(self) -> t.List[t.Union[dict, ItemRecord]]:
+        if self.compact_items:
+            return self.extract_records()
         return [value for i in self.items if (value := i.to_dict())]
 
+    def extract_records(self) -> t.List[ItemRecord]:
+        """
+        Extracts items into records, bypassing the cache of the `items` field, so that item fragments
+        (with their selectors) are dropped right after extraction.
+
+        >>> class Link(PageFragment):
+        ...     url = Css('a::attr(href)')
+        >>> class Links(PageModel):
+        ...     compact_items = True
+        ...     items = Css('p', many=True, model=Link)
+        >>> Links("<p><a href='/a'>A</a></p><p><a href='/b'>B</a></p>").extracted
+        [LinkRecord(url='/a'), LinkRecord(url='/b')]
+        """
+        items_field = getattr(type(self), "items", None)
+        fragments = items_field._get_value(self) if isinstance(items_field, Field) else self.items
+        return [record for fragment in fragments if (record := fragment.to_record())]
+
+    def invalidate(self, *names: str) -> None:
+        super().invalidate(*names)
+        self.__dict__.pop("extracted", None)
+
     @classmethod
     def url_modifier(cls, url: Url) -> Url:
         return url
@@ -0,0 +1,115 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import enum
+import random
+import typing as t
+
+from httpx import (
+    NetworkError,
+    RemoteProtocolError,
+    Response,
+    TimeoutException,
+)
+
+
+RETRYABLE_ERRORS = (TimeoutException, NetworkError, RemoteProtocolError)
+RETRYABLE_STATUSES = frozenset((408, 429))
+
+
+class Outcome(enum.Enum):
+    SUCCESS = "success"
+    RETRYABLE = "retryable"
+    TERMINAL = "terminal"
+
+
+def classify(response: t.Optional[Response] = None, error: t.Optional[Exception] = None) -> Outcome:
+    """
+    >>> [classify(Response(status)).value for status in (200, 304, 404, 410, 429, 503)]
+    ['success', 'success', 'terminal', 'terminal', 'retryable', 'retryable']
+    >>> classify(error=TimeoutException('timeout', request=None))
+    <Outcome.RETRYABLE: 'retryable'>
+    """
+    if error is not None:
+        return Outcome.RETRYABLE if isinstance(error, RETRYABLE_ERRORS) else Outcome.TERMINAL
+    if response.status_code < 400:
+        return Outcome.SUCCESS
+    if response.status_code in RETRYABLE_STATUSES or response.status_code >= 500:
+        return Outcome.RETRYABLE
+    return Outcome.TERMINAL
+
+
+def get_retry_after(response: t.Optional[Response], now: datetime = None) -> t.Optional[float]:
+    """
+    Reads the `Retry-After` header, given either in seconds or as an HTTP date.
+
+    >>> get_retry_after(Response(503, headers={'retry-after': '120'}))
+    120.0
+    >>> now = datetime(2015, 10, 21, 7, 28, tzinfo=timezone.utc)
+    >>> get_retry_after(Response(503, headers={'retry-after': 'Wed, 21 Oct 2015 07:28:30 GMT'}), now=now)
+    30.0
+    >>> get_retry_after(Response(503, headers={'retry-after': 'soon'})) is None
+    True
+    """
+    if response is None or not (value := response.headers.get("retry-after")):
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = now or datetime.now(timezone.utc)
+    return max((retry_at - now).total_seconds(), 0.0)
+
+
+class RetryPolicy:
+    """
+    Decides whether and when a failed request should be retried: exponential backoff with jitter,
+    overridden by the server's `Retry-After`, limited by the attempts per URL and by the total budget
+    of retries of its owner.
+
+    >>> policy = RetryPolicy(attempts=3, delay=0.5, backoff=2, max_delay=10, jitter=0, budget=3)
+    >>> [policy.next_delay(attempt) for attempt in range(3)]
+    [0.5, 1.0, None]
+    >>> policy.next_delay(0, Response(429, headers={'retry-after': '60'}))
+    10
+    >>> policy.next_delay(0) is None  # budget is spent
+    True
+    >>> policy.stats()
+    {'retries': 3, 'budget': 3}
+    """
+
+    def __init__(
+        self,
+        attempts: int,
+        delay: float,
+        backoff: float = 2.0,
+        max_delay: float = 60.0,
+        jitter: float = 0.5,
+        budget: t.Optional[int] = None,
+    ) -> None:
+        self.attempts = attempts
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.budget = budget
+        self._retries: int = 0
+
+    def next_delay(self, attempt: int, response: t.Optional[Response] = None) -> t.Optional[float]:
+        """
+        Returns the delay (in seconds) before retrying after the failed `attempt` (counted from zero)
+        or None if the request shouldn't be retried.
+        """
+        if attempt + 1 >= self.attempts or (self.budget is not None and self._retries >= self.budget):
+            return None
+        self._retries += 1
+        if (retry_after := get_retry_after(response)) is not None:
+            return min(retry_after, self.max_delay)
+        delay = min(self.delay * self.backoff ** attempt, self.max_delay)
+        return delay * random.uniform(1 - self.jitter, 1)
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        return {"retries": self._retries, "budget": self.budget}
@@ -1,5 +1,6 @@
 import asyncio
 from contextlib import AsyncExitStack
+import dataclasses
 import datetime
 import typing as t
 
@@ -9,40 +10,94 @@ from bga.common.debugging import (
     interactive_stop,
     post_mortem,
 )
+from bga.common.files import get_data_filepath
 from bga.common.measures import Timer
+from .changes import ChangeDetector
+from .daemon import Daemon
+from .export import export_run, is_available as is_export_available
+from .extraction import Extractor
 from .logging import LogManager
+from .sharding import run_sharded
 from .spider import (
-    get_spiders,
+    get_configs,
+    run_spiders,
     ProcessState,
     SIGNALS,
 )
-from .storage import Storage
+from .storage import STORAGES, Storage, get_storage
 
 
 async def async_main(process_state: ProcessState):
     async with LogManager(process_state):
         # LogManager is separate from other managers because we want to close the managers
         # and then log something about them
+        summary = {}
         async with AsyncExitStack() as stack:
             await stack.enter_async_context(timer := Timer())
-            await stack.enter_async_context(Storage(process_state))
-            spiders = get_spiders(process_state)
-            SIGNALS.meta.started.send(process_state, spiders=spiders)
-            awaitables = (spider.run() for spider in spiders)
-            try:
-                results = await asyncio.wait_for(asyncio.gather(*awaitables), timeout=process_state.timeout)
-            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
-                SIGNALS.meta.error.send(process_state, error=e)
+            storage = await stack.enter_async_context(get_storage(process_state))
+            if process_state.detect_changes:
+                # entered after the storage, to be closed before it
+                await stack.enter_async_context(ChangeDetector(process_state))
+            if process_state.is_daemon:
+                extractor = await stack.enter_async_context(
+                    Extractor(process_state.extraction_executor, process_state.extraction_workers)
+                )
+                spiders, summary = await Daemon(process_state, extractor).run()
+            elif process_state.workers > 1:
+                spiders, summary = await run_sharded(process_state)
             else:
-                task_errors = [result for result in results if isinstance(result, Exception)]
-                if task_errors:
-                    SIGNALS.meta.error.send(process_state, error=task_errors)
-        SIGNALS.meta.finished.send(process_state, spiders=spiders, timer=timer)
+                extractor = await stack.enter_async_context(
+                    Extractor(process_state.extraction_executor, process_state.extraction_workers)
+                )
+                spiders = await run_spiders(process_state, extractor=extractor)
+        if process_state.export:
+            export(process_state, storage)
+        SIGNALS.meta.finished.send(process_state, spiders=spiders, timer=timer, **summary)
 
 
-def scraper(interactive: bool, scheduler: bool, interval: int, spiders: t.Tuple[str, ...]):
+def export(process_state: ProcessState, storage: Storage) -> None:
+    """Exports tables of the run, when all the items have been stored."""
+    names = tuple({table.rsplit(".changes", 1)[0] for table in storage.tables})
+    chosen = dataclasses.replace(process_state, is_scheduler_on=False, spiders_chosen=names)
+    try:
+        export_run(storage, get_configs(chosen), directory=get_data_filepath(process_state.output_dirpath))
+    except Exception as e:
+        # the items are stored anyway, the run still finishes
+        SIGNALS.meta.error.send(process_state, error=e)
+
+
+def scraper(
+    interactive: bool,
+    scheduler: bool,
+    daemon: bool,
+    interval: int,
+    executor: t.Optional[str],
+    extraction_workers: t.Optional[int],
+    resume: bool,
+    workers: int,
+    storage: str,
+    changes: bool,
+    export: bool,
+    spiders: t.Tuple[str, ...],
+):
+    if daemon and workers > 1:
+        raise click.UsageError("--daemon runs the spiders in a single process, --workers can't be used with it")
+    if export and not is_export_available():
+        raise click.UsageError("--export needs pyarrow to be installed (the `export` extra)")
     interactive_stop(interactive, "process starting", locals())
-    ps = ProcessState(interval=datetime.timedelta(hours=interval), spiders_chosen=spiders, is_scheduler_on=scheduler)
+    ps = ProcessState(
+        interval=datetime.timedelta(hours=interval),
+        spiders_chosen=spiders,
+        is_scheduler_on=scheduler,
+        is_daemon=daemon,
+        extraction_executor=executor,
+        extraction_workers=extraction_workers,
+        resume=resume,
+        workers=workers,
+        storage=storage,
+        detect_changes=changes,
+        export=export,
+    )
     loop = asyncio.get_event_loop()
     loop.slow_callback_duration = ps.slow_task_duration
     loop.run_until_complete(async_main(ps))
@@ -53,7 +108,15 @@ def scraper(interactive: bool, scheduler: bool, interval: int, spiders: t.Tuple[
 @click.option("--debug/--no-debug", default=False)
 @click.option("-i", "--interactive", is_flag=True)
 @click.option("-s", "--scheduler", is_flag=True)
+@click.option("--daemon", is_flag=True, help="Stay resident and start the spiders when their time slots come")
 @click.option("--interval", type=click.INT, default=1)
+@click.option("--executor", type=click.Choice(["process", "thread"]), default=None, help="Where to parse pages")
+@click.option("--extraction-workers", type=click.INT, default=None)
+@click.option("--resume", is_flag=True, help="Continue interrupted crawls of spiders keeping checkpoints")
+@click.option("--workers", type=click.INT, default=1, help="Processes to distribute the spiders across")
+@click.option("--storage", type=click.Choice(list(STORAGES)), default="jsonl", help="Where to store the items")
+@click.option("--changes", is_flag=True, help="Report new, changed and disappeared items")
+@click.option("--export", is_flag=True, help="Export the items of the run to Parquet files at the end")
 @click.argument("spiders", nargs=-1, default=None)
 def command(debug: bool, **kwargs):
     if debug:
@@ -2,7 +2,7 @@ import asyncio
 from functools import singledispatch
 import typing as t
 
-from httpx import Response
+from httpx import Response, ResponseNotRead
 
 from bga.common.measures import Timer
 
@@ -54,7 +54,11 @@ def _serialize_spider(obj: Spider) -> str:
 
 @serialize_value.register(Response)
 def _serialize_response(obj: Response) -> str:
-    return f"[{obj.status_code}] len={len(obj.text)}"
+    try:
+        return f"[{obj.status_code}] len={len(obj.content)}"
+    except ResponseNotRead:
+        # a streamed response
+        return f"[{obj.status_code}]"
 
 
 @serialize_value.register(Timer)
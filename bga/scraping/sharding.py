@@ -0,0 +1,222 @@
+import asyncio
+import dataclasses
+import functools
+import multiprocessing
+import multiprocessing.synchronize
+import queue
+import typing as t
+
+from .config import ProcessState
+from .extraction import Extractor
+from .page import ItemRecord
+from .serialization import serialize_value
+from .signals import SIGNALS
+from .spider import get_configs, run_spiders
+
+
+# signals about the whole process are sent by the parent, not forwarded from the workers
+PARENT_SIGNALS = frozenset(("meta:started", "meta:finished", "output:storage_backlogged", "output:storage_caught_up"))
+# how often workers check whether the parent's storage keeps up, in seconds
+STORAGE_CHECK_INTERVAL = 0.1
+# counters of `spider_ended` reports summed up for all the spiders
+SUMMED = ("urls_total", "items_extracted", "urls_failed", "urls_invalid", "errors")
+# signal name, name of the sender and arguments of the signal
+Event = t.Tuple[str, str, t.Dict[str, t.Any]]
+
+
+def shard(names: t.Iterable[str], workers: int) -> t.List[t.Tuple[str, ...]]:
+    """
+    >>> shard(['c', 'a', 'd', 'b', 'e'], workers=2)
+    [('a', 'c', 'e'), ('b', 'd')]
+    >>> shard(['a'], workers=4)
+    [('a',)]
+    """
+    names = sorted(names)
+    return [tuple(names[i::workers]) for i in range(min(workers, len(names)))]
+
+
+def to_portable(value: t.Any) -> t.Any:
+    """
+    Keeps plain data as it is and serializes anything else, so that signal arguments can be sent between processes.
+
+    >>> to_portable({'urls': {'https://example.com'}, 'items_extracted': 2, 'errors': [ValueError('x')]})
+    {'urls': {'https://example.com'}, 'items_extracted': 2, 'errors': ["ValueError('x')"]}
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, ItemRecord):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {k: to_portable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return type(value)(to_portable(v) for v in value)
+    return serialize_value(value)
+
+
+def summarize(ended: t.Mapping[str, t.Mapping[str, t.Any]]) -> t.Dict[str, int]:
+    """
+    Combines `spider_ended` reports of spiders run by all the workers.
+
+    >>> summarize({'a': {'urls_total': 3, 'items_extracted': 10, 'urls_failed': 1, 'urls_invalid': 0, 'errors': 0},
+    ...            'b': {'urls_total': 2, 'items_extracted': 5, 'urls_failed': 0, 'urls_invalid': 0, 'errors': 1}})
+    {'spiders_ended': 2, 'urls_total': 5, 'items_extracted': 15, 'urls_failed': 1, 'urls_invalid': 0, 'errors': 1}
+    """
+    summary = {"spiders_ended": len(ended)}
+    for name in SUMMED:
+        summary[name] = sum(report[name] for report in ended.values())
+    return summary
+
+
+class WorkerSender:
+    """Stands in the parent process for the sender of a forwarded signal, usually a spider."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __str__(self) -> str:
+        return self.name
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {self.name}>"
+
+
+class EventForwarder:
+    """Puts signals sent in a worker process to the queue read by the parent."""
+
+    def __init__(self, events: multiprocessing.Queue) -> None:
+        self.events = events
+
+    def connect(self) -> None:
+        for namespace in SIGNALS.values():
+            for signal in namespace.values():
+                if signal.name not in PARENT_SIGNALS:
+                    signal.connect(self._forwarder_factory(signal.name), weak=False)
+
+    def _forwarder_factory(self, name: str) -> t.Callable[..., None]:
+        def forward(sender, **kwargs):
+            self.events.put((name, serialize_value(sender), to_portable(kwargs)))
+
+        return forward
+
+
+class EventReceiver:
+    """Sends signals forwarded by the workers again in the parent, for its `LogManager` and `Storage`."""
+
+    def __init__(self) -> None:
+        self.senders: t.Dict[str, WorkerSender] = {}
+        self.spiders: t.List[WorkerSender] = []
+        self.ended: t.Dict[str, t.Dict[str, t.Any]] = {}
+
+    async def receive(self, events: multiprocessing.Queue, processes: t.Sequence[multiprocessing.Process]) -> None:
+        """Dispatches events until every worker is done or dead."""
+        loop = asyncio.get_event_loop()
+        running = len(processes)
+        while running:
+            try:
+                event = await loop.run_in_executor(None, functools.partial(events.get, timeout=1.0))
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+                continue
+            if event is None:
+                running -= 1
+            else:
+                self.dispatch(event)
+
+    def dispatch(self, event: Event) -> None:
+        name, sender_name, kwargs = event
+        if (sender := self.senders.get(sender_name)) is None:
+            sender = self.senders[sender_name] = WorkerSender(sender_name)
+        if name == "meta:spider_registered":
+            self.spiders.append(sender)
+        elif name == "spider:spider_ended":
+            self.ended[sender_name] = kwargs
+        namespace, signal_name = name.split(":")
+        SIGNALS[namespace][signal_name].send(sender, **kwargs)
+
+
+def run_worker(
+    process_state: ProcessState, events: multiprocessing.Queue, storage_ready: multiprocessing.synchronize.Event
+) -> None:
+    """Entry point of a worker process: runs its share of the spiders in its own event loop."""
+    EventForwarder(events).connect()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_run_worker(process_state, storage_ready))
+    finally:
+        events.put(None)
+        loop.close()
+
+
+async def _run_worker(process_state: ProcessState, storage_ready: multiprocessing.synchronize.Event) -> None:
+    relay = asyncio.create_task(relay_storage_state(process_state, storage_ready))
+    try:
+        async with Extractor(process_state.extraction_executor, process_state.extraction_workers) as extractor:
+            await run_spiders(process_state, extractor=extractor)
+    finally:
+        relay.cancel()
+
+
+async def relay_storage_state(process_state: ProcessState, storage_ready: multiprocessing.synchronize.Event) -> None:
+    """
+    Sends `output:storage_backlogged` and `output:storage_caught_up` in the worker when the parent's storage
+    falls behind and catches up (see `bga.scraping.storage.Storage`), so that its spiders wait for it.
+    """
+    is_ready = True
+    while True:
+        await asyncio.sleep(STORAGE_CHECK_INTERVAL)
+        if storage_ready.is_set() is is_ready:
+            continue
+        is_ready = not is_ready
+        signal = SIGNALS.output.storage_caught_up if is_ready else SIGNALS.output.storage_backlogged
+        signal.send(process_state)
+
+
+async def run_sharded(process_state: ProcessState) -> t.Tuple[t.List[WorkerSender], t.Dict[str, t.Any]]:
+    """
+    Distributes the spiders chosen for the process across `process_state.workers` processes.
+    Returns stand-ins of the spiders and the combined summary of their runs, for `meta:finished`.
+    Whether the storage keeps up is shared with the workers, so that their spiders wait for it.
+    """
+    shards = shard((config.name for config in get_configs(process_state)), process_state.workers)
+    SIGNALS.meta.started.send(process_state, shards=shards)
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    storage_ready = context.Event()
+    storage_ready.set()
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(
+                dataclasses.replace(process_state, spiders_chosen=names, is_scheduler_on=False, workers=1),
+                events,
+                storage_ready,
+            ),
+            name=f"{process_state.name}-worker-{i}",
+        )
+        for i, names in enumerate(shards)
+    ]
+    for process in processes:
+        process.start()
+    receiver = EventReceiver()
+
+    def on_backlogged(sender: t.Any, **kwargs) -> None:
+        storage_ready.clear()
+
+    def on_caught_up(sender: t.Any, **kwargs) -> None:
+        storage_ready.set()
+
+    SIGNALS.output.storage_backlogged.connect(on_backlogged)
+    SIGNALS.output.storage_caught_up.connect(on_caught_up)
+    try:
+        await receiver.receive(events, processes)
+    finally:
+        SIGNALS.output.storage_backlogged.disconnect(on_backlogged)
+        SIGNALS.output.storage_caught_up.disconnect(on_caught_up)
+    loop = asyncio.get_event_loop()
+    for process in processes:
+        await loop.run_in_executor(None, process.join)
+        if process.exitcode:
+            SIGNALS.meta.error.send(process_state, error=f"{process.name} exited with {process.exitcode}")
+    return receiver.spiders, {"workers": len(processes), "summary": summarize(receiver.ended)}
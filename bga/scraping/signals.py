@@ -18,17 +18,26 @@ class NamedNamespace(asyncblink.Namespace):
 meta_signals = NamedNamespace("meta")
 meta_signals.spider_registered = meta_signals.signal("spider_registered")
 meta_signals.started = meta_signals.signal("started")
+meta_signals.spider_overlapping = meta_signals.signal("spider_overlapping")
 meta_signals.error = meta_signals.signal("error")
 meta_signals.finished = meta_signals.signal("finished")
 
 spider_signals = NamedNamespace("spider")
 spider_signals.spider_started = spider_signals.signal("spider_started")
+spider_signals.spider_resumed = spider_signals.signal("spider_resumed")
 spider_signals.spider_ticked = spider_signals.signal("spider_ticked")
 spider_signals.url_registered = spider_signals.signal("url_registered")
 spider_signals.url_processing_started = spider_signals.signal("url_processing_started")
 spider_signals.url_fetching_started = spider_signals.signal("url_fetching_started")
 spider_signals.url_fetched = spider_signals.signal("url_fetched")
+spider_signals.url_cache_hit = spider_signals.signal("url_cache_hit")
+spider_signals.url_cache_miss = spider_signals.signal("url_cache_miss")
+spider_signals.url_unchanged = spider_signals.signal("url_unchanged")
 spider_signals.url_error = spider_signals.signal("url_error")
+spider_signals.url_retry_scheduled = spider_signals.signal("url_retry_scheduled")
+spider_signals.catalogue_held = spider_signals.signal("catalogue_held")
+spider_signals.concurrency_adjusted = spider_signals.signal("concurrency_adjusted")
+spider_signals.spider_draining = spider_signals.signal("spider_draining")
 spider_signals.spider_ended = spider_signals.signal("spider_ended")
 
 output_signals = NamedNamespace("output")
@@ -36,5 +45,10 @@ output_signals.url_failed = output_signals.signal("url_failed")
 output_signals.url_response_valid = output_signals.signal("url_response_valid")
 output_signals.url_response_invalid = output_signals.signal("url_response_invalid")
 output_signals.items_extracted = output_signals.signal("items_extracted")
+output_signals.items_changed = output_signals.signal("items_changed")
+output_signals.items_written = output_signals.signal("items_written")
+output_signals.storage_backlogged = output_signals.signal("storage_backlogged")
+output_signals.storage_caught_up = output_signals.signal("storage_caught_up")
+output_signals.table_exported = output_signals.signal("table_exported")
 
 SIGNALS = Bunch(spider=spider_signals, meta=meta_signals, output=output_signals)
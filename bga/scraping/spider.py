@@ -1,29 +1,71 @@
 import asyncio
+from datetime import datetime
 import typing as t
 
 import httpx
 from pca.data.descriptors import reify
+from pca.utils.imports import import_dotted_path
 
+from bga.common.canonicalization import Canonicalizer
+from bga.common.files import get_data_dirs
 from bga.common.measures import Timer
 from bga.common.urls import Url
 
+from .accounting import CrawlAccount
+from .caching import ResponseCache
+from .checkpointing import Checkpoint, SeenUrls, UrlState
 from .config import ProcessState, SpiderConfig
-from .fetching import bound_fetch
-from .page import PageModel, PageMetadata
+from .extraction import ExtractionResult, Extractor, get_model_path
+from .fetching import ClientPool, bound_fetch, bound_stream
+from .frontier import Frontier, FrontierEntry
+from .incremental import FingerprintStore, content_fingerprint
+from .page import ItemRecord, PageModel, PageMetadata
+from .retrying import Outcome, RetryPolicy, classify
 from .signals import SIGNALS
+from .streaming import ItemStream
+from .throttling import AdaptiveLimiter, RateLimiter, get_rate_limiter
 
 
 class Spider:
-    def __init__(self, config: SpiderConfig, process_state: ProcessState):
+    def __init__(
+        self,
+        config: SpiderConfig,
+        process_state: ProcessState,
+        extractor: Extractor = None,
+        client_pool: ClientPool = None,
+        cache: ResponseCache = None,
+    ):
         self.config = config
         self.process_state = process_state
-        self._semaphore = asyncio.Semaphore(config.concurrency_policy.task_limit)
-        self._urls_processed: t.MutableSet[Url] = set()
-        self._urls_failed: t.MutableSet[Url] = set()
-        self._urls_invalid: t.MutableSet[Url] = set()
-        self._tasks_pending: t.MutableSet[asyncio.Task] = set()
-        self._tasks_done: t.MutableSet[asyncio.Task] = set()
+        self._extractor = extractor or Extractor()
+        self._limiter = AdaptiveLimiter(owner=self, **config.concurrency_policy.concurrency_limiter_kwargs)
+        self._retry_policy = RetryPolicy(**config.concurrency_policy.retry_policy_kwargs)
+        # a pool given to share it between runs (see `bga.scraping.daemon`) is closed by whoever gave it
+        self._owns_client_pool = client_pool is None
+        self._client_pool = client_pool or get_client_pool(config)
+        self._cache = cache or get_cache(config)
+        if self._cache:
+            self._cache.owner = self
+        self._checkpoint = self._get_checkpoint()
+        self._fingerprints = self._get_fingerprints()
+        self._canonicalizer = Canonicalizer(**config.url_policy.canonicalizer_kwargs)
+        self._urls_seen = SeenUrls(**config.checkpoint_policy.seen_urls_kwargs)
+        # hrefs as found on pages, to tell how many fetches canonicalization saved
+        self._hrefs_seen = SeenUrls(**config.checkpoint_policy.seen_urls_kwargs)
+        self._fetches_saved: int = 0
+        self._account = CrawlAccount()
+        self._frontier = Frontier(owner=self, **config.concurrency_policy.frontier_kwargs)
         self._items_extracted: int = 0
+        self._pages_unchanged: int = 0
+        self._deadline_reached: t.Optional[str] = None  # "soft" or "hard"
+        # whether all the URLs found were processed: not cut short by a deadline, cancelled or crashed
+        self._is_complete: bool = False
+        self.run_id: t.Optional[str] = None  # when the run started, naming it in storages
+        # cleared while the storage falls behind, see `bga.scraping.storage.Storage`
+        self._storage_ready = asyncio.Event()
+        self._storage_ready.set()
+        SIGNALS.output.storage_backlogged.connect(self._on_storage_backlogged)
+        SIGNALS.output.storage_caught_up.connect(self._on_storage_caught_up)
         SIGNALS.meta.spider_registered.send(self)
 
     @reify
@@ -34,86 +76,306 @@ class Spider:
         return f"<{self.__class__.__name__} {self.name} {id(self)}>"
 
     async def run(self):
-        SIGNALS.spider.spider_started.send(self)
-        self._create_tasks(urls=self.config.start_urls, model_class=self.config.start_model)
-        while len(self._tasks_pending):
-            done, pending = await asyncio.wait(
-                self._tasks_pending, timeout=self.config.concurrency_policy.task_check_interval
-            )
-            SIGNALS.spider.spider_ticked.send(self, done=done, pending=pending)
-            self._tasks_pending.difference_update(done)
-            self._tasks_done.update(done)
-        results = await asyncio.gather(*self._tasks_done, return_exceptions=True)
-        errors = [result for result in results if isinstance(result, Exception)]
+        if not self._owns_client_pool:
+            await self._run()
+            return
+        async with self._client_pool:
+            await self._run()
+
+    async def _run(self):
+        self.run_id = datetime.now().isoformat(timespec="seconds")
+        SIGNALS.spider.spider_started.send(self, run_id=self.run_id)
+        self._restore()
+        self._register_urls(urls=self.config.start_urls, model_class=self.config.start_model)
+        loop = asyncio.get_event_loop()
+        ticker = asyncio.create_task(self._tick())
+        deadline_policy = self.config.deadline_policy
+        soft_deadline = None
+        if deadline_policy.soft:
+            soft_deadline = loop.call_later(deadline_policy.soft.total_seconds(), self._stop_discovery)
+        workers = [asyncio.create_task(self._work()) for _ in range(self.config.concurrency_policy.workers)]
+        try:
+            _, pending = await asyncio.wait(workers, timeout=deadline_policy.get_hard_deadline(self.process_state))
+            if pending:
+                self._deadline_reached = "hard"
+            else:
+                # the workers return when the frontier drains, or when the soft deadline closes it
+                self._is_complete = not self._frontier.is_closed
+        finally:
+            for task in (ticker, *workers):
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if soft_deadline:
+                soft_deadline.cancel()
+            self._finish()
+
+    def _stop_discovery(self) -> None:
+        """Soft deadline: URLs being processed are finished, queued and newly found ones are left for resuming."""
+        self._deadline_reached = "soft"
+        dropped = self._frontier.close()
+        SIGNALS.spider.spider_draining.send(self, urls_dropped=dropped, urls_in_progress=self._frontier.unfinished)
+
+    def _finish(self) -> None:
+        if self._checkpoint:
+            # a completed crawl has nothing to resume
+            if self._is_complete:
+                self._checkpoint.clear()
+            self._checkpoint.close()
+        if self._fingerprints:
+            self._fingerprints.close()
         SIGNALS.spider.spider_ended.send(
             self,
-            urls_failed=self._urls_failed,
-            urls_invalid=self._urls_invalid,
-            urls_total=len(self._urls_processed),
+            urls_total=len(self._urls_seen),
             items_extracted=self._items_extracted,
-            errors=errors,
+            pages_unchanged=self._pages_unchanged,
+            deadline_reached=self._deadline_reached,
+            is_complete=self._is_complete,
+            **self._account.report(),
+            connection_pool=self._client_pool.stats(),
+            cache=self._cache.stats() if self._cache else None,
+            retries=self._retry_policy.stats(),
+            canonicalization={"fetches_saved": self._fetches_saved, **self._canonicalizer.cache_info()},
         )
 
-    def _create_tasks(self, urls: t.Sequence[Url], model_class: t.Type[PageModel]) -> None:
-        processing_urls = set(model_class.url_modifier(u) for u in urls)
-        new_urls = processing_urls - self._urls_processed
-        for url in new_urls:
-            task = asyncio.create_task(self._process_url(url, model_class), name=url)
-            self._urls_processed.add(url)
-            self._tasks_pending.add(task)
-            SIGNALS.spider.url_registered.send(self, task=task)
-
-    async def _process_url(self, url: Url, model_class: t.Type[PageModel]):
-        SIGNALS.spider.url_processing_started.send(self, url=url, model_class=model_class)
-        response = await self._make_request(url=url)
-        if response:
-            model = model_class(response.text, metadata=self._get_page_metadata(url, html=response.text))
-            if model.is_valid_response():
-                SIGNALS.output.url_response_valid.send(self, url=url, response=response)
-                self._extract(model)
-            else:
-                self._urls_invalid.add(url)
-                SIGNALS.output.url_response_invalid.send(self, url=url, response=response)
+    async def _work(self) -> None:
+        """Processes URLs of the frontier until it drains."""
+        while True:
+            # URLs being processed are finished, but new ones wait for the storage to catch up
+            await self._storage_ready.wait()
+            if (entry := await self._frontier.pop()) is None:
+                return
+            try:
+                await self._process_url(entry)
+            except Exception as e:
+                self._account.error(entry.url, e)
+                self._mark(entry.url, UrlState.FAILED)
+            # not when the worker is cancelled (which isn't an `Exception`): the URL stays queued for resuming
+            self._frontier.done()
+
+    def _on_storage_backlogged(self, sender: t.Any, **kwargs) -> None:
+        self._storage_ready.clear()
+
+    def _on_storage_caught_up(self, sender: t.Any, **kwargs) -> None:
+        self._storage_ready.set()
+
+    async def _tick(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.concurrency_policy.task_check_interval)
+            SIGNALS.spider.spider_ticked.send(self, **self._frontier.depths(), unfinished=self._frontier.unfinished)
+
+    def _restore(self) -> None:
+        """Continues the interrupted crawl from the checkpoint or, unless resuming, starts a new one."""
+        if not self._checkpoint:
+            return
+        if not self.process_state.resume:
+            self._checkpoint.clear()
+            return
+        for url, model_path, priority, attempt, state in self._checkpoint.load():
+            self._urls_seen.add(url)
+            if state is UrlState.QUEUED:
+                model_class = import_dotted_path(model_path)
+                self._frontier.push(
+                    url, model_class, priority=priority, attempt=attempt, is_details=self._is_details(model_class)
+                )
+            elif state is UrlState.FAILED:
+                self._account.failed(url)
+            elif state is UrlState.INVALID:
+                self._account.invalid(url)
+        SIGNALS.spider.spider_resumed.send(self, urls_seen=len(self._urls_seen), urls_queued=len(self._frontier))
+
+    def _register_urls(self, urls: t.Sequence[Url], model_class: t.Type[PageModel]) -> None:
+        for href in urls:
+            href = model_class.url_modifier(href)
+            is_new_href = self._hrefs_seen.add(href)
+            url = self._canonicalizer(href)
+            if not self._urls_seen.add(url):
+                # exact matching of hrefs would fetch the URL again
+                self._fetches_saved += is_new_href
+                continue
+            self._enqueue(url, model_class)
+            SIGNALS.spider.url_registered.send(self, url=url, model_class=model_class)
+
+    def _enqueue(
+        self, url: Url, model_class: t.Type[PageModel], priority: int = 0, attempt: int = 0, delay: float = 0.0
+    ) -> None:
+        self._frontier.push(
+            url, model_class, priority=priority, attempt=attempt, delay=delay, is_details=self._is_details(model_class)
+        )
+        if self._checkpoint:
+            self._checkpoint.queue(url, get_model_path(model_class), priority=priority, attempt=attempt)
+
+    def _is_details(self, model_class: t.Type[PageModel]) -> bool:
+        return model_class is self.config.details_model
+
+    def _mark(self, url: Url, state: UrlState) -> None:
+        """Records that processing of the URL finished."""
+        if state is UrlState.FAILED:
+            self._account.failed(url)
+        elif state is UrlState.INVALID:
+            self._account.invalid(url)
+        if self._checkpoint:
+            self._checkpoint.finish(url, state)
+
+    async def _process_url(self, entry: FrontierEntry):
+        url, model_class = entry.url, entry.model_class
+        if not entry.attempt:
+            SIGNALS.spider.url_processing_started.send(self, url=url, model_class=model_class)
+            if model_class.is_streamed and await self._stream_url(url, model_class):
+                return
+        response = await self._make_request(entry)
+        if not response:
+            return
+        # the body is shared, not copied, by the metadata of models retaining it
+        body = response.content
+        if self._fingerprints:
+            fingerprint = content_fingerprint(body, model_class.fingerprint_ignored)
+            if self._follow_unchanged(url, fingerprint):
+                return
+        metadata = self._get_page_metadata(
+            url, body=body if model_class.retains_body else None, encoding=response.encoding
+        )
+        result = await self._extractor.extract(model_class, body, response.encoding, metadata)
+        self._handle_result(url, model_class, response, result)
+        if self._fingerprints and result.is_valid:
+            self._fingerprints.store(url, fingerprint, result.catalogue_urls, result.details_urls)
 
-    async def _make_request(self, url) -> t.Optional[httpx.Response]:
-        # TODO coordinate between requests and throttle request rate
-        await asyncio.sleep(self.config.concurrency_policy.request_delay)
-        response = timer = None
+    def _follow_unchanged(self, url: Url, fingerprint: int) -> bool:
+        """Follows URLs found on the page the last time, if it hasn't changed since then."""
+        known = self._fingerprints.get(url)
+        if known is None or known.fingerprint != fingerprint:
+            return False
+        self._pages_unchanged += 1
+        SIGNALS.spider.url_unchanged.send(self, url=url)
+        self._follow(known.catalogue_urls, known.details_urls)
+        self._mark(url, UrlState.DONE)
+        return True
+
+    async def _stream_url(self, url: Url, model_class: t.Type[PageModel]) -> bool:
+        """
+        Parses the page while it's being downloaded; its items are pushed once it's known to be valid.
+        Returns False when the page should be processed the regular way, with retries: the response
+        isn't successful or the request failed.
+        """
+        rate_limiter = get_rate_limiter(url, **self.config.concurrency_policy.rate_limiter_kwargs)
         SIGNALS.spider.url_fetching_started.send(self, url=url)
-        for _ in range(tries := self.config.concurrency_policy.url_retries):
-            with Timer() as timer:
-                # TODO be resilent to 4xx & 5xx responses
-                try:
-                    response = await bound_fetch(
-                        semaphore=self._semaphore,
-                        url=url,
-                        client_kwargs=self.config.request_policy.client_kwargs,
-                        request_kwargs=self.config.request_policy.request_kwargs,
+        with Timer() as timer:
+            try:
+                async with bound_stream(
+                    limiter=self._limiter,
+                    url=url,
+                    client=self._client_pool.get(url),
+                    request_kwargs=self.config.request_policy.request_kwargs,
+                    rate_limiter=rate_limiter,
+                ) as response:
+                    if classify(response=response) is not Outcome.SUCCESS:
+                        return False
+                    stream = ItemStream(
+                        model_class, self._get_page_metadata(url, body=None), encoding=response.charset_encoding
                     )
-                except httpx.RequestError as e:
-                    response = None
-                    SIGNALS.spider.url_error.send(self, url=url, error=e, timer=timer)
-                else:
-                    if response and response.status_code < 400:
-                        SIGNALS.spider.url_fetched.send(self, url=url, response=response, timer=timer)
-                        return response
-                    else:
-                        SIGNALS.spider.url_error.send(self, url=url, response=response, timer=timer)
-        self._urls_failed.add(url)
-        SIGNALS.output.url_failed.send(self, url=url, response=response, tries=tries)
+                    async for chunk in response.aiter_bytes():
+                        stream.feed(chunk)
+            except httpx.RequestError as e:
+                SIGNALS.spider.url_error.send(self, url=url, error=e, timer=timer)
+                return False
+        SIGNALS.spider.url_fetched.send(self, url=url, response=response, timer=timer)
+        self._handle_result(url, model_class, response, stream.close())
+        return True
+
+    def _handle_result(
+        self, url: Url, model_class: t.Type[PageModel], response: httpx.Response, result: ExtractionResult
+    ) -> None:
+        if result.is_valid:
+            SIGNALS.output.url_response_valid.send(self, url=url, response=response)
+            self._extract(result, model_class)
+            self._mark(url, UrlState.DONE)
+        else:
+            self._mark(url, UrlState.INVALID)
+            SIGNALS.output.url_response_invalid.send(self, url=url, response=response)
+
+    async def _make_request(self, entry: FrontierEntry) -> t.Optional[httpx.Response]:
+        url, attempt = entry.url, entry.attempt
+        rate_limiter = get_rate_limiter(url, **self.config.concurrency_policy.rate_limiter_kwargs)
+        SIGNALS.spider.url_fetching_started.send(self, url=url)
+        response, outcome = await self._fetch(url, rate_limiter)
+        if outcome is Outcome.SUCCESS:
+            return response
+        if outcome is Outcome.RETRYABLE and (delay := self._retry_policy.next_delay(attempt, response)) is not None:
+            # the retry goes back to the frontier with a lower priority, not holding a worker while waiting
+            SIGNALS.spider.url_retry_scheduled.send(self, url=url, attempt=attempt + 1, delay=delay)
+            self._enqueue(url, entry.model_class, priority=entry.priority + 1, attempt=attempt + 1, delay=delay)
+            return None
+        self._mark(url, UrlState.FAILED)
+        SIGNALS.output.url_failed.send(self, url=url, response=response, tries=attempt + 1)
         return None
 
-    def _get_page_metadata(self, url: Url, html: str) -> PageMetadata:
-        return PageMetadata(url=url, domain=self.config.domain, source_html=html)
+    async def _fetch(self, url: Url, rate_limiter: RateLimiter) -> t.Tuple[t.Optional[httpx.Response], Outcome]:
+        response = error = None
+        with Timer() as timer:
+            try:
+                response = await bound_fetch(
+                    limiter=self._limiter,
+                    url=url,
+                    request_kwargs=self.config.request_policy.request_kwargs,
+                    client=self._client_pool.get(url),
+                    rate_limiter=rate_limiter,
+                    cache=self._cache,
+                )
+            except httpx.RequestError as e:
+                error = e
+        outcome = classify(response=response, error=error)
+        if outcome is Outcome.SUCCESS:
+            SIGNALS.spider.url_fetched.send(self, url=url, response=response, timer=timer)
+        elif error is not None:
+            SIGNALS.spider.url_error.send(self, url=url, error=error, timer=timer, outcome=outcome)
+        else:
+            SIGNALS.spider.url_error.send(self, url=url, response=response, timer=timer, outcome=outcome)
+        return response, outcome
+
+    def _get_checkpoint(self) -> t.Optional[Checkpoint]:
+        policy = self.config.checkpoint_policy
+        if not policy.is_enabled:
+            return None
+        path = get_data_dirs()[0] / "scraping" / "checkpoints" / f"{self.name}.sqlite"
+        return Checkpoint(path, flush_every=policy.flush_every)
+
+    def _get_fingerprints(self) -> t.Optional[FingerprintStore]:
+        policy = self.config.incremental_policy
+        if not policy.is_enabled:
+            return None
+        path = get_data_dirs()[0] / "scraping" / "fingerprints" / f"{self.name}.sqlite"
+        return FingerprintStore(path, max_age=policy.max_age, flush_every=policy.flush_every)
+
+    def _get_page_metadata(
+        self, url: Url, body: t.Optional[bytes], encoding: t.Optional[str] = None
+    ) -> PageMetadata:
+        return PageMetadata(url=url, domain=self.config.domain, body=body, encoding=encoding)
+
+    def _extract(self, result: ExtractionResult, model_class: t.Type[PageModel]):
+        self._follow(result.catalogue_urls, result.details_urls)
+        self._push_items(result.items, model_class)
 
-    def _extract(self, model: PageModel):
+    def _follow(self, catalogue_urls: t.Sequence[Url], details_urls: t.Sequence[Url]) -> None:
         if catalogue_model := self.config.catalogue_model:
-            self._create_tasks(urls=model.catalogue_urls, model_class=catalogue_model)
+            self._register_urls(urls=catalogue_urls, model_class=catalogue_model)
         if details_model := self.config.details_model:
-            self._create_tasks(urls=model.details_urls, model_class=details_model)
-        if extracted_items := model.extracted:
-            SIGNALS.output.items_extracted.send(self, items=extracted_items)
-            self._items_extracted += len(extracted_items)
+            self._register_urls(urls=details_urls, model_class=details_model)
+
+    def _push_items(self, items: t.List[t.Union[dict, ItemRecord]], model_class: t.Type[PageModel]) -> None:
+        if items:
+            SIGNALS.output.items_extracted.send(self, items=items, item_key=model_class.item_key)
+            self._items_extracted += len(items)
+
+
+def get_client_pool(config: SpiderConfig) -> ClientPool:
+    return ClientPool(client_kwargs=config.request_policy.client_kwargs, **config.request_policy.pool_kwargs)
+
+
+def get_cache(config: SpiderConfig) -> t.Optional[ResponseCache]:
+    policy = config.cache_policy
+    if not policy.is_enabled:
+        return None
+    directory = get_data_dirs()[0] / "scraping" / "cache" / config.name
+    return ResponseCache(directory, ttl=policy.ttl, max_size=policy.max_size)
 
 
 def get_configs(process_state: ProcessState) -> t.List[SpiderConfig]:
@@ -125,6 +387,20 @@ def get_configs(process_state: ProcessState) -> t.List[SpiderConfig]:
         return [config for config in shops.CONFIGS if config.name in process_state.spiders_chosen]
 
 
-def get_spiders(process_state: ProcessState) -> t.Set[Spider]:
+def get_spiders(process_state: ProcessState, **kwargs) -> t.Set[Spider]:
     configs = get_configs(process_state)
-    return {Spider(config=config, process_state=process_state) for config in configs}
+    return {Spider(config=config, process_state=process_state, **kwargs) for config in configs}
+
+
+async def run_spiders(process_state: ProcessState, **kwargs) -> t.Set[Spider]:
+    """
+    Runs the spiders chosen for the process concurrently. Each spider keeps to its own deadlines
+    (within the process timeout), so a slow one doesn't cut the others short.
+    """
+    spiders = get_spiders(process_state, **kwargs)
+    SIGNALS.meta.started.send(process_state, spiders=spiders)
+    results = await asyncio.gather(*(spider.run() for spider in spiders), return_exceptions=True)
+    task_errors = [result for result in results if isinstance(result, Exception)]
+    if task_errors:
+        SIGNALS.meta.error.send(process_state, error=task_errors)
+    return spiders
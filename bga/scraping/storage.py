@@ -1,25 +1,364 @@
+import abc
+import asyncio
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import sqlite3
+import threading
+import time
+import typing as t
+
 from aiotinydb import AIOTinyDB
 
 from bga.common.files import get_data_filepath
+from bga.common.measures import Timer
 from .config import ProcessState
+from .page import ItemRecord
 from .signals import SIGNALS
 from .spider import Spider
 
 
-class Storage(AIOTinyDB):
+# table, items, their key field and when they were queued
+QueuedItems = t.Tuple[str, t.List[dict], t.Optional[str], float]
+
+
+def get_changes_table(name: str) -> str:
+    """Table of changes of the spider's items, see `bga.scraping.changes`."""
+    return f"{name}.changes"
+
+
+class Storage(abc.ABC):
+    """
+    Base of the storages of items sent with `output:items_extracted`; items of each spider go to its own table.
+    Subclasses write the items in `write` (and `flush`) and may open and close their files in `open` and `close`.
+    `key` is the name of the field identifying the items across runs, if their model has one (`item_key`).
+    Subclasses missing `write` or `read` can't be instantiated.
+
+    >>> class WriteOnlyStorage(Storage):
+    ...     def write(self, table, items, key=None):
+    ...         pass
+    >>> WriteOnlyStorage(ProcessState())  # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+    TypeError: Can't instantiate abstract class WriteOnlyStorage with abstract method read
+
+    Items are written behind the crawl: they are queued and written in batches of `batch_size` items
+    (or whatever has been queued for `batch_interval` seconds) by a thread of their own, so that
+    serialization and I/O don't stall the event loop. `output:items_written` tells the depth of the queue
+    and how long the batch took. With more than `max_queued` items waiting, `output:storage_backlogged`
+    is sent and spiders stop taking new URLs until the queue is half as long (`output:storage_caught_up`).
+
+    Changes of items sent with `output:items_changed` (see `bga.scraping.changes`) go to `<spider>.changes` tables.
+    Items of the run are read back, table by table, with `read` (e.g. to export them after the run). What a run
+    is depends on the storage: the latest run of the spider, for storages telling runs apart (`SqliteStorage`),
+    or everything the process wrote, for ones with files of their own (so all the runs of the daemon).
+    """
+
     def __init__(self, process_state: ProcessState) -> None:
-        self._filename = process_state.output_filepath
-        filepath = get_data_filepath(process_state.output_filepath)
-        super().__init__(filename=filepath)
+        self.process_state = process_state
+        policy = process_state.storage_policy
+        self.max_queued = policy.max_queued
+        self.batch_size = policy.batch_size
+        self.batch_interval = policy.batch_interval
+        self.tables: t.Set[str] = set()  # written in this run
+        self._queue: t.Deque[QueuedItems] = deque()
+        self._queued: int = 0
+        self._is_backlogged: bool = False
+        self._is_closing: bool = False
+        self._batch_ready: t.Optional[asyncio.Event] = None
+        self._writer: t.Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
 
-    async def __aenter__(self) -> None:
-        await super().__aenter__()
+    async def __aenter__(self) -> "Storage":
+        await self.open()
+        self._batch_ready = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_behind())
         SIGNALS.output.items_extracted.connect(self.push)
+        SIGNALS.output.items_changed.connect(self.push_changes)
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        SIGNALS.output.items_extracted.disconnect(self.push)
+        SIGNALS.output.items_changed.disconnect(self.push_changes)
+        self._is_closing = True
+        self._batch_ready.set()
+        await self._writer
+        self._executor.shutdown()
+        await self.close()
+
+    def push(self, sender: Spider, **kwargs) -> None:
+        items = [i.to_dict() if isinstance(i, ItemRecord) else i for i in kwargs.get("items", [])]
+        if items:
+            self._enqueue(sender.name, items, kwargs.get("item_key"))
+
+    def push_changes(self, sender: Spider, **kwargs) -> None:
+        self._enqueue(get_changes_table(sender.name), kwargs["changes"], None)
+
+    def _enqueue(self, table: str, items: t.List[dict], key: t.Optional[str]) -> None:
+        self.tables.add(table)
+        self._queue.append((table, items, key, time.monotonic()))
+        self._queued += len(items)
+        if self._queued >= self.batch_size:
+            self._batch_ready.set()
+        if self._queued > self.max_queued and not self._is_backlogged:
+            self._is_backlogged = True
+            SIGNALS.output.storage_backlogged.send(self, queued=self._queued)
+
+    async def open(self) -> None:
+        pass
 
-    def push(self, sender: Spider, **kwargs):
-        items = kwargs.get("items", [])
-        table = self.table(sender.name)
-        table.insert_multiple(items)
+    async def close(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def write(self, table: str, items: t.List[dict], key: t.Optional[str] = None) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def read(self, table: str) -> t.Iterator[dict]:
+        """Items of the table written in this run; the storage may be closed already."""
+
+    async def _write_behind(self) -> None:
+        loop = asyncio.get_event_loop()
+        while not (self._is_closing and not self._queue):
+            if self._queued < self.batch_size and not self._is_closing:
+                self._batch_ready.clear()
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), timeout=self.batch_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if not self._queue:
+                continue
+            batch, self._queue = list(self._queue), deque()
+            waited = time.monotonic() - batch[0][3]
+            with Timer() as timer:
+                try:
+                    await loop.run_in_executor(self._executor, self._write_batch, batch)
+                except Exception as e:
+                    SIGNALS.meta.error.send(self, error=e)
+            written = sum(len(items) for _, items, _, _ in batch)
+            self._queued -= written
+            SIGNALS.output.items_written.send(self, items=written, queued=self._queued, waited=waited, timer=timer)
+            if self._is_backlogged and self._queued <= self.max_queued // 2:
+                self._is_backlogged = False
+                SIGNALS.output.storage_caught_up.send(self, queued=self._queued)
+
+    def _write_batch(self, batch: t.List[QueuedItems]) -> None:
+        for table, items, key, _ in batch:
+            self.write(table, items, key=key)
+        self.flush()
+
+
+class TinyDbStorage(Storage):
+    """
+    All the tables in a single TinyDB file. The database is kept in memory and written on close,
+    but each write serializes the whole of it again. Reading a table can't be streamed either:
+    the whole file is loaded.
+    """
+
+    def __init__(self, process_state: ProcessState) -> None:
+        super().__init__(process_state)
+        self._filename = process_state.output_filepath
+        self._db = AIOTinyDB(filename=get_data_filepath(self._filename))
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self._filename})"
+
+    async def open(self) -> None:
+        await self._db.__aenter__()
+
+    async def close(self) -> None:
+        await self._db.__aexit__(None, None, None)
+
+    def write(self, table: str, items: t.List[dict], key: t.Optional[str] = None) -> None:
+        self._db.table(table).insert_multiple(items)
+
+    def read(self, table: str) -> t.Iterator[dict]:
+        """Items of the table written by the process; all of them are loaded at once."""
+        with open(get_data_filepath(self._filename), encoding="utf-8") as file:
+            yield from json.load(file).get(table, {}).values()
+
+
+class JsonLinesStorage(Storage):
+    """
+    A JSON Lines file per table, `<table>.jsonl`, only appended to: a write costs as much as its items.
+    Lines are buffered and written every `flush_every` items; the files are synced to the disk on close.
+
+    >>> import asyncio, pathlib, tempfile
+    >>> storage = JsonLinesStorage(ProcessState(), flush_every=2)
+    >>> storage.directory = pathlib.Path(tempfile.mkdtemp())
+    >>> storage.write('shop', [{'name': 'Catan'}])
+    >>> (storage.directory / 'shop.jsonl').exists()
+    False
+    >>> storage.write('shop', [{'name': 'Azul', 'price': 120.5}])
+    >>> asyncio.get_event_loop().run_until_complete(storage.close())
+    >>> print((storage.directory / 'shop.jsonl').read_text(), end='')
+    {"name": "Catan"}
+    {"name": "Azul", "price": 120.5}
+    >>> list(storage.read('shop'))
+    [{'name': 'Catan'}, {'name': 'Azul', 'price': 120.5}]
+    """
+
+    def __init__(self, process_state: ProcessState, flush_every: int = 1000) -> None:
+        super().__init__(process_state)
+        self.flush_every = flush_every
+        self.directory = get_data_filepath(process_state.output_dirpath)
+        self._files: t.Dict[str, t.TextIO] = {}
+        self._buffers: t.DefaultDict[str, t.List[str]] = defaultdict(list)
+        self._buffered: int = 0
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.directory})"
+
+    async def open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    async def close(self) -> None:
+        self.flush()
+        for file in self._files.values():
+            os.fsync(file.fileno())
+            file.close()
+        self._files.clear()
+
+    def write(self, table: str, items: t.List[dict], key: t.Optional[str] = None) -> None:
+        self._buffers[table].extend(f"{json.dumps(item, ensure_ascii=False)}\n" for item in items)
+        self._buffered += len(items)
+        if self._buffered >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        for table, lines in self._buffers.items():
+            if (file := self._files.get(table)) is None:
+                file = self._files[table] = open(self.directory / f"{table}.jsonl", "a", encoding="utf-8")
+            file.writelines(lines)
+            file.flush()
+        self._buffers.clear()
+        self._buffered = 0
+
+    def read(self, table: str) -> t.Iterator[dict]:
+        """Items of the table written by the process, one line at a time."""
+        with open(self.directory / f"{table}.jsonl", encoding="utf-8") as file:
+            for line in file:
+                yield json.loads(line)
+
+
+class SqliteStorage(Storage):
+    """
+    Items of all the runs in a single SQLite database, `scraping/items.sqlite`, so that questions across runs
+    are answered with indexes. Items having a key (see `PageModel.item_key`) are updated in place, keeping
+    the run they were first and last seen in; items without one are only added. A run of a spider is named
+    after the time it started. Writes are buffered and done in a single transaction per `flush_every` items.
+    The connection is shared by the event loop and the thread writing the items, one of them at a time.
+
+    >>> import asyncio, pathlib
+    >>> storage = SqliteStorage(ProcessState())
+    >>> storage.path = pathlib.Path(':memory:')
+    >>> asyncio.get_event_loop().run_until_complete(storage.open())
+    >>> storage.runs['shop'] = '2019-08-14T12:00:00'
+    >>> storage.write('shop', [{'url': '/a', 'price': 10}, {'url': '/b', 'price': 20}], key='url')
+    >>> storage.runs['shop'] = '2019-08-15T12:00:00'
+    >>> storage.write('shop', [{'url': '/a', 'price': 12}], key='url')
+    >>> storage.get('shop', '/a')
+    {'url': '/a', 'price': 12}
+    >>> storage.connection.execute('SELECT key, first_run, run FROM items ORDER BY key').fetchall()
+    [('/a', '2019-08-14T12:00:00', '2019-08-15T12:00:00'), ('/b', '2019-08-14T12:00:00', '2019-08-14T12:00:00')]
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS items (spider TEXT NOT NULL, key TEXT, item TEXT NOT NULL, "
+        "first_run TEXT NOT NULL, run TEXT NOT NULL)",
+        # NULL keys don't conflict, so items without a key are always added
+        "CREATE UNIQUE INDEX IF NOT EXISTS items_spider_key ON items (spider, key)",
+        "CREATE INDEX IF NOT EXISTS items_spider_run ON items (spider, run)",
+    )
+    UPSERT = (
+        "INSERT INTO items (spider, key, item, first_run, run) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (spider, key) DO UPDATE SET item = excluded.item, run = excluded.run"
+    )
+
+    def __init__(self, process_state: ProcessState, flush_every: int = 1000) -> None:
+        super().__init__(process_state)
+        self.flush_every = flush_every
+        self.path = get_data_filepath("scraping/items.sqlite")
+        self.runs: t.DefaultDict[str, str] = defaultdict(lambda: process_state.start.isoformat(timespec="seconds"))
+        self.connection: t.Optional[sqlite3.Connection] = None
+        self._pending: t.List[t.Tuple[str, t.Optional[str], str, str, str]] = []
+        # guards the connection, pending rows and runs
+        self._lock = threading.RLock()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path})"
+
+    async def open(self) -> None:
+        if self.path.name != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        with self.connection:
+            for statement in self.SCHEMA:
+                self.connection.execute(statement)
+        SIGNALS.spider.spider_started.connect(self.start_run)
+
+    async def close(self) -> None:
+        SIGNALS.spider.spider_started.disconnect(self.start_run)
+        with self._lock:
+            self.flush()
+            self.connection.close()
+
+    def start_run(self, sender: Spider, run_id: str, **kwargs) -> None:
+        # spiders started by the daemon, or resumed, don't share the start of the process
+        with self._lock:
+            self.runs[sender.name] = self.runs[get_changes_table(sender.name)] = run_id
+
+    def write(self, table: str, items: t.List[dict], key: t.Optional[str] = None) -> None:
+        rows = []
+        for item in items:
+            item_key = item.get(key) if key else None
+            rows.append((None if item_key is None else str(item_key), json.dumps(item, ensure_ascii=False)))
+        with self._lock:
+            run = self.runs[table]
+            self._pending.extend((table, item_key, item, run, run) for item_key, item in rows)
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    def flush(self) -> None:
+        with self._lock, self.connection:
+            self.connection.executemany(self.UPSERT, self._pending)
+            self._pending.clear()
+
+    def read(self, table: str) -> t.Iterator[dict]:
+        """
+        Items last seen in the latest run of the spider (the one started last by this process),
+        not in the earlier runs of the daemon; streamed from the database.
+        """
+        connection = sqlite3.connect(str(self.path))
+        try:
+            rows = connection.execute("SELECT item FROM items WHERE spider = ? AND run = ?", (table, self.runs[table]))
+            for (item,) in rows:
+                yield json.loads(item)
+        finally:
+            connection.close()
+
+    def get(self, table: str, key: str) -> t.Optional[dict]:
+        """The latest version of the item."""
+        with self._lock:
+            self.flush()
+            row = self.connection.execute(
+                "SELECT item FROM items WHERE spider = ? AND key = ?", (table, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+STORAGES: t.Dict[str, t.Type[Storage]] = {
+    "jsonl": JsonLinesStorage,
+    "sqlite": SqliteStorage,
+    "tinydb": TinyDbStorage,
+}
+
+
+def get_storage(process_state: ProcessState) -> Storage:
+    return STORAGES[process_state.storage](process_state)
@@ -0,0 +1,149 @@
+import typing as t
+
+from lxml import etree
+from parsel import Selector, SelectorList
+from parsel.csstranslator import HTMLTranslator
+
+from .extraction import ExtractionResult
+from .page import Css, ItemRecord, PageMetadata, PageModel
+
+
+# fields of the page's URLs, collected while the page is parsed when they're `Css` fields
+URL_FIELDS = ("catalogue_urls", "details_urls")
+
+
+class SelfMatchTranslator(HTMLTranslator):
+    """
+    Translates CSS into an XPath testing whether the context element itself matches the selector.
+    Combinators look at ancestors and preceding siblings only, so the test works on a partially parsed
+    document, as soon as the element is closed. Pseudo-classes looking ahead (like `:last-child`) can't
+    be decided that early. Pseudo-elements select the element's text or attributes.
+
+    >>> SelfMatchTranslator().css_to_xpath('ul > li a, h2 + p', prefix='self::')
+    'self::a[ancestor::li[parent::ul]] | self::p[preceding-sibling::*[1][self::h2]]'
+    >>> SelfMatchTranslator().css_to_xpath('li a::attr(href)', prefix='self::')
+    'self::a[ancestor::li]/@href'
+    """
+
+    def xpath_descendant_combinator(self, left, right):
+        return right.add_condition(f"ancestor::{left}")
+
+    def xpath_child_combinator(self, left, right):
+        return right.add_condition(f"parent::{left}")
+
+    def xpath_direct_adjacent_combinator(self, left, right):
+        return right.add_condition(f"preceding-sibling::*[1][self::{left}]")
+
+    def xpath_indirect_adjacent_combinator(self, left, right):
+        return right.add_condition(f"preceding-sibling::{left}")
+
+
+_self_match_translator = SelfMatchTranslator()
+
+
+def compile_self_match(css_selector: str) -> etree.XPath:
+    """
+    >>> matches = compile_self_match('.navigation a')
+    >>> root = etree.fromstring("<div class='navigation'><p><a>1</a></p></div>")
+    >>> [bool(matches(element)) for element in root.iter()]
+    [False, False, True]
+    """
+    return etree.XPath(_self_match_translator.css_to_xpath(css_selector, prefix="self::"), smart_strings=False)
+
+
+class ItemStream:
+    """
+    Incrementally parses a page fed chunk by chunk and extracts items of the model's `items` field
+    as soon as their elements are closed. Elements of extracted items are dropped from the tree, so that
+    the page is never held in memory whole. URLs of `Css` fields `catalogue_urls` and `details_urls`
+    are collected the same way, as their elements are closed; other fields are evaluated when the stream
+    is closed, on what's left of the page. So does `is_valid_response`, which doesn't see the items.
+    Items are returned only then, so that nothing of an invalid page gets out.
+    The `items` field has to be a `Css` field with a `model`.
+
+    >>> from bga.scraping.example import ExampleMoreLink
+    >>> class Catalogue(PageModel):
+    ...     items = Css('.products a', many=True, model=ExampleMoreLink)
+    ...     catalogue_urls = Css('.pager a::attr(href)', many=True)
+    ...     details_urls = Css('.products a::attr(href)', many=True)
+    ...     def is_valid_response(self):
+    ...         return not self.selector.css('.error') and not self.selector.css('.products a')
+    >>> stream = ItemStream(Catalogue, metadata=None)
+    >>> stream.feed(b"<html><body><div class='products'><a href='/1'>1</a><a href='/2'>2</a>")
+    >>> stream.feed(b"<a href='/3'>3</a></div><div class='pager'><a href='?page=2'>2</a></div></body></html>")
+    >>> stream.close()  # doctest: +NORMALIZE_WHITESPACE
+    ExtractionResult(is_valid=True,
+     items=[{'title': '1', 'url': '/1'}, {'title': '2', 'url': '/2'}, {'title': '3', 'url': '/3'}],
+     catalogue_urls=['?page=2'], details_urls=['/1', '/2', '/3'])
+    >>> stream = ItemStream(Catalogue, metadata=None)
+    >>> stream.feed(b"<div class='error'>Try later</div><div class='products'><a href='/1'>1</a></div>")
+    >>> stream.close()
+    ExtractionResult(is_valid=False, items=[], catalogue_urls=[], details_urls=[])
+    """
+
+    def __init__(
+        self, model_class: t.Type[PageModel], metadata: t.Optional[PageMetadata], encoding: t.Optional[str] = None
+    ) -> None:
+        items_field = getattr(model_class, "items", None)
+        if not isinstance(items_field, Css) or not items_field.model:
+            raise ValueError(f"{model_class.__name__}.items has to be a Css field with a model to be streamed")
+        self.model_class = model_class
+        self.metadata = metadata
+        self._items_field = items_field
+        self._matches = compile_self_match(items_field.css_selector)
+        self._url_queries = {
+            name: compile_self_match(field.css_selector)
+            for name in URL_FIELDS
+            if isinstance(field := getattr(model_class, name, None), Css) and not field.model
+        }
+        self._url_values: t.Dict[str, t.List[t.Any]] = {name: [] for name in self._url_queries}
+        self._parser = etree.HTMLPullParser(events=("end",), encoding=encoding)
+        self._items: t.List[t.Union[dict, ItemRecord]] = []
+        # elements of extracted items, removed from the tree once the parser is past them
+        self._spent: t.List[etree._Element] = []
+
+    def feed(self, data: bytes) -> None:
+        self._parser.feed(data)
+        self._read_events()
+
+    def close(self) -> ExtractionResult:
+        root = self._parser.close()
+        self._read_events()
+        self._remove_spent()
+        model = self.model_class(selector=Selector(root=root, type="html"), metadata=self.metadata)
+        for name, values in self._url_values.items():
+            field = getattr(self.model_class, name)
+            model._values[field.name] = field._clean(
+                model, SelectorList([Selector(root=value, type="html") for value in values])
+            )
+        items, self._items = self._items, []
+        if not model.is_valid_response():
+            return ExtractionResult(is_valid=False)
+        return ExtractionResult(
+            is_valid=True,
+            items=items,
+            catalogue_urls=list(model.catalogue_urls),
+            details_urls=list(model.details_urls),
+        )
+
+    def _read_events(self) -> None:
+        for _, element in self._parser.read_events():
+            for name, query in self._url_queries.items():
+                self._url_values[name].extend(query(element))
+            if self._matches(element):
+                self._extract(element)
+
+    def _extract(self, element: etree._Element) -> None:
+        item = self._items_field.model(selector=Selector(root=element, type="html"), metadata=self.metadata)
+        if value := (item.to_record() if self.model_class.compact_items else item.to_dict()):
+            self._items.append(value)
+        # the element itself is removed with the next one, when the parser is surely past it
+        self._remove_spent()
+        element.clear()
+        self._spent.append(element)
+
+    def _remove_spent(self) -> None:
+        for element in self._spent:
+            if (parent := element.getparent()) is not None:
+                parent.remove(element)
+        self._spent.clear()
@@ -0,0 +1,172 @@
+import asyncio
+import time
+import typing as t
+
+from bga.common.urls import Url, get_host_from_url
+from .signals import SIGNALS
+
+
+class RateLimiter:
+    """
+    Token bucket with a burst capacity and a minimal spacing between consecutive requests.
+
+    Each call reserves the earliest free slot, so concurrent callers are served in FIFO order
+    without a lock: the reservation doesn't await anything.
+
+    >>> now = [0.0]
+    >>> limiter = RateLimiter(rate=2, burst=2, min_interval=0.1, clock=lambda: now[0])
+    >>> [limiter.reserve() for _ in range(4)]
+    [0.0, 0.1, 0.5, 1.0]
+    >>> now[0] = 10.0
+    >>> limiter.reserve()
+    0.0
+
+    Without a rate, only the spacing applies
+    >>> limiter = RateLimiter(rate=None, min_interval=0.5, clock=lambda: now[0])
+    >>> [limiter.reserve() for _ in range(3)]
+    [0.0, 0.5, 1.0]
+    """
+
+    def __init__(
+        self,
+        rate: t.Optional[float] = None,
+        burst: int = 1,
+        min_interval: float = 0.0,
+        clock: t.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.min_interval = min_interval
+        self._clock = clock
+        self._tokens: float = burst
+        self._updated: float = clock()
+        self._last_slot: t.Optional[float] = None
+
+    def reserve(self) -> float:
+        """Reserves a slot for a request and returns how long (in seconds) the caller has to wait for it."""
+        now = self._clock()
+        slot = now
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens < 0:
+                slot = now - self._tokens / self.rate
+        if self._last_slot is not None:
+            slot = max(slot, self._last_slot + self.min_interval)
+        self._last_slot = slot
+        return round(slot - now, 6)
+
+    async def acquire(self) -> None:
+        if (delay := self.reserve()) > 0:
+            await asyncio.sleep(delay)
+
+
+_rate_limiters: t.Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(url: Url, **kwargs) -> RateLimiter:
+    """
+    Returns the limiter of the URL's host, shared by every spider requesting that host.
+    The first caller for the host configures the limiter.
+
+    >>> limiter = get_rate_limiter(Url('https://www.iana.org/domains'), rate=1.0)
+    >>> get_rate_limiter(Url('https://www.iana.org/about'), rate=5.0) is limiter
+    True
+    >>> limiter.rate
+    1.0
+    """
+    host = get_host_from_url(url)
+    if (limiter := _rate_limiters.get(host)) is None:
+        limiter = _rate_limiters[host] = RateLimiter(**kwargs)
+    return limiter
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limiter with an AIMD policy: the limit grows additively (by one per `limit` healthy
+    responses) and is cut multiplicatively on congestion (429, 5xx, timeouts), within `min_limit`
+    and `max_limit`. Slow responses (over `latency_threshold`) hold the limit still.
+    Congestion signalled by requests started before the latest cut doesn't cut the limit again.
+
+    >>> now = [0.0]
+    >>> limiter = AdaptiveLimiter(initial=2, min_limit=1, max_limit=4, latency_threshold=1, clock=lambda: now[0])
+    >>> for _ in range(3):
+    ...     limiter.record(started=0.0, is_congested=False)
+    >>> limiter.current_limit, round(limiter.limit, 2)
+    (3, 3.24)
+    >>> now[0] = 5.0
+    >>> limiter.record(started=3.0, is_congested=False)
+    >>> round(limiter.limit, 2)
+    3.24
+    >>> limiter.record(started=4.5, is_congested=True)
+    >>> limiter.record(started=4.6, is_congested=True)
+    >>> limiter.current_limit, round(limiter.limit, 2)
+    (1, 1.62)
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: t.Optional[int] = None,
+        latency_threshold: t.Optional[float] = None,
+        decrease_factor: float = 0.5,
+        owner: t.Any = None,
+        clock: t.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit or initial
+        self.latency_threshold = latency_threshold
+        self.decrease_factor = decrease_factor
+        self.owner = owner
+        self.clock = clock
+        self.limit: float = initial
+        self._in_flight: int = 0
+        self._last_decrease: float = float("-inf")
+        self._internal_condition: t.Optional[asyncio.Condition] = None
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {self.current_limit} in_flight={self._in_flight}>"
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    @property
+    def _condition(self) -> asyncio.Condition:
+        # created lazily to bind it with the running loop
+        if self._internal_condition is None:
+            self._internal_condition = asyncio.Condition()
+        return self._internal_condition
+
+    async def __aenter__(self) -> "AdaptiveLimiter":
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.current_limit)
+            self._in_flight += 1
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify(max(self.current_limit - self._in_flight, 0))
+
+    def record(self, started: float, is_congested: bool) -> None:
+        """Feeds the outcome of a request started at `started` (by the limiter's clock) back to the limiter."""
+        now = self.clock()
+        previous_limit = self.current_limit
+        if is_congested:
+            if started < self._last_decrease:
+                return
+            self.limit = max(self.limit * self.decrease_factor, self.min_limit)
+            self._last_decrease = now
+            reason = "congestion"
+        elif self.latency_threshold is None or now - started <= self.latency_threshold:
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+            reason = "healthy"
+        else:
+            return
+        if self.current_limit != previous_limit:
+            SIGNALS.spider.concurrency_adjusted.send(
+                self.owner or self, limit=self.current_limit, previous_limit=previous_limit, reason=reason
+            )
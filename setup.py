@@ -21,6 +21,9 @@ if __name__ == "__main__":
         install_requires=[
             "dataclasses; python_version < '3.7'",
         ],
+        extras_require={
+            "export": ["pyarrow>=2.0.0"],
+        },
         tests_require=["pytest"],
         packages=find_packages(),
     )